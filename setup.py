@@ -33,9 +33,10 @@ setup(
     # code or data files as normal operating system files.
     zip_safe=False,
 
+    python_requires=">=3.7",
     install_requires=[
         "numpy",
-        "pandas",
+        "pandas>=0.24",
         "tables"
     ],
     name="tableseries",
@@ -58,8 +59,6 @@ setup(
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Topic :: Software Development",
         "Topic :: Software Development :: Libraries"
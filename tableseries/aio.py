@@ -0,0 +1,177 @@
+# encoding:utf-8
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncTableSeries(object):
+    """
+    asyncio api over a store, the blocking calls run in the executors instead
+    of the event loop. the writes run one at a time on a single writer thread,
+    the reads run on a bounded pool of the reader threads. the range iterator
+    reads a partition per executor call, a long range read doesn't hold a
+    reader thread between the partitions.
+    """
+
+    def __init__(self, store, max_workers=4):
+        """
+        :param store: TimeSeriesDayPartition, TimeSeriesMonthPartition or TimeSeriesYearPartition,
+            a read only store with thread_safe=True reads in parallel
+        :param max_workers: max number of the reader threads
+        """
+        if not isinstance(max_workers, int) or max_workers <= 0:
+            raise ValueError("max_workers must be a positive integer")
+        self.store = store
+        self._reader = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tableseries-reader")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tableseries-writer")
+
+    async def _run(self, executor, func, *args, **kwargs):
+        """
+        :param executor:
+        :param func:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    async def append(self, name, data_frame, duplicates=None):
+        """
+        :param name:
+        :param data_frame:
+        :param duplicates: skip, reject or overwrite, the store policy if None
+        :return:
+        """
+        return await self._run(self._writer, self.store.append, name, data_frame, duplicates=duplicates)
+
+    async def delete(self, name, year=None, month=None, day=None):
+        """
+        :param name:
+        :param year:
+        :param month:
+        :param day:
+        :return:
+        """
+        return await self._run(self._writer, self.store.delete, name, year, month, day)
+
+    async def flush(self):
+        """
+        :return:
+        """
+        return await self._run(self._writer, self.store.flush)
+
+    async def get_granularity(self, name, year=None, month=None, day=None, **kwargs):
+        """
+        :param name:
+        :param year:
+        :param month:
+        :param day:
+        :param kwargs: columns and return_type of the store get_granularity
+        :return:
+        """
+        return await self._run(self._reader, self.store.get_granularity, name, year, month, day, **kwargs)
+
+    async def get_granularity_range(self, name, start_datetime, end_datetime=None, **kwargs):
+        """
+        async iterator of the partitions between the datetimes
+        :param name:
+        :param start_datetime:
+        :param end_datetime:
+        :param kwargs: columns, return_type and chunk_rows of the store get_granularity_range
+        :return:
+        """
+        iterator = self.store.get_granularity_range(name, start_datetime, end_datetime, **kwargs)
+        sentinel = object()
+        future = None
+        try:
+            while True:
+                future = self._reader.submit(next, iterator, sentinel)
+                result = await asyncio.wrap_future(future)
+                if result is sentinel:
+                    break
+                yield result
+        finally:
+            # the cancelled read may be still running in the reader thread
+            if future is None:
+                iterator.close()
+            else:
+                future.add_done_callback(lambda _: iterator.close())
+
+    async def get_aggregate(self, name, start_datetime, end_datetime=None, **kwargs):
+        """
+        :param name:
+        :param start_datetime:
+        :param end_datetime:
+        :param kwargs: freq, aggs, chunk_rows and rollups of the store get_aggregate
+        :return:
+        """
+        return await self._run(self._reader, self.store.get_aggregate, name, start_datetime, end_datetime,
+                               **kwargs)
+
+    async def tail(self, name, n=5, **kwargs):
+        """
+        :param name:
+        :param n:
+        :param kwargs: columns and return_type of the store tail
+        :return:
+        """
+        return await self._run(self._reader, self.store.tail, name, n, **kwargs)
+
+    async def last(self, name, **kwargs):
+        """
+        :param name:
+        :param kwargs: columns and return_type of the store last
+        :return:
+        """
+        return await self._run(self._reader, self.store.last, name, **kwargs)
+
+    async def length(self, name):
+        """
+        :param name:
+        :return:
+        """
+        return await self._run(self._reader, self.store.length, name)
+
+    async def first_datetime(self, name):
+        """
+        :param name:
+        :return:
+        """
+        return await self._run(self._reader, self.store.first_datetime, name)
+
+    async def last_datetime(self, name):
+        """
+        :param name:
+        :return:
+        """
+        return await self._run(self._reader, self.store.last_datetime, name)
+
+    async def close(self):
+        """
+        wait for the submitted calls and close the store
+        :return:
+        """
+        try:
+            await self._run(self._writer, self._close)
+        finally:
+            self._writer.shutdown(wait=False)
+
+    def _close(self):
+        """
+        :return:
+        """
+        self._reader.shutdown()
+        self.store.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __repr__(self):
+        """
+        :return:
+        """
+        return "<{0} {1!r}>".format(type(self).__name__, self.store)
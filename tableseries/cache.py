@@ -0,0 +1,81 @@
+# encoding:utf-8
+import collections
+import threading
+
+
+class ReadCache(object):
+    """
+    least recently used cache of the decoded partition records bounded by the
+    bytes of the records, the records are shared and must not be modified.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        :param max_bytes: max bytes of the cached records
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        """
+        :param key: (partition path, columns)
+        :return: None if the key isn't cached
+        """
+        with self._lock:
+            records = self._entries.get(key)
+            if records is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return records
+
+    def put(self, key, records):
+        """
+        cache the records and evict the least recently used records over the
+        max bytes, the records larger than the max bytes aren't cached
+        :param key: (partition path, columns)
+        :param records:
+        :return:
+        """
+        if records.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key).nbytes
+            self._entries[key] = records
+            self.nbytes += records.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def invalidate(self, path):
+        """
+        drop the records of the partition path and the partitions under it
+        :param path:
+        :return:
+        """
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key[0] == path or key[0].startswith(path + "/")]:
+                self.nbytes -= self._entries.pop(key).nbytes
+
+    def clear(self):
+        """
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def info(self):
+        """
+        :return: hits, misses, entries, nbytes and max_bytes
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "nbytes": self.nbytes, "max_bytes": self.max_bytes}
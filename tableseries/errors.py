@@ -0,0 +1,5 @@
+# encoding:utf-8
+
+
+class TableSeriesError(Exception):
+    pass
@@ -0,0 +1,120 @@
+# encoding:utf-8
+import threading
+from contextlib import contextmanager
+
+import tables
+
+# the hdf5 library isn't built thread safe, the calls of the threads on the
+# handles of the same or the different files must not overlap. the lock is
+# taken after the store lock, the pool condition is never held while waiting
+# for it
+HDF5_LOCK = threading.RLock()
+
+
+class HandlePool(object):
+    """
+    bounded pool of the read only hdf5 file handles, a handle is used by one
+    thread at a time.
+    """
+
+    def __init__(self, filename, size=4, **kwargs):
+        """
+        :param filename:
+        :param size: max number of the opened handles
+        :param kwargs: tables.open_file parameters
+        """
+        self.filename = filename
+        self.size = size
+        self._kwargs = kwargs
+        self._condition = threading.Condition()
+        self._idle = []
+        self._handles = []
+        # number of the handles being opened
+        self._opening = 0
+        # incremented by reset and close
+        self._generation = 0
+
+    def acquire(self):
+        """
+        get an idle handle, open a new handle under the size,
+        otherwise wait for a released handle
+        :return:
+        """
+        with self._condition:
+            while not self._idle and len(self._handles) + self._opening >= self.size:
+                self._condition.wait()
+            if self._idle:
+                return self._idle.pop()
+            # reserve the slot of the new handle
+            self._opening += 1
+            generation = self._generation
+        try:
+            with HDF5_LOCK:
+                handle = tables.open_file(self.filename, mode="r", **self._kwargs)
+        except Exception:
+            with self._condition:
+                self._opening -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opening -= 1
+            if generation == self._generation:
+                self._handles.append(handle)
+            # the handle opened before a reset is closed when released
+            return handle
+
+    def release(self, handle):
+        """
+        :param handle:
+        :return:
+        """
+        with self._condition:
+            pooled = handle in self._handles
+            if pooled:
+                self._idle.append(handle)
+            self._condition.notify()
+        if not pooled:
+            # the handle was reset while it's used
+            with HDF5_LOCK:
+                handle.close()
+
+    def reset(self):
+        """
+        close the idle handles, the used handles are closed when released,
+        the later acquires open new handles
+        :return:
+        """
+        with self._condition:
+            idle = self._idle
+            self._handles = []
+            self._idle = []
+            self._generation += 1
+            self._condition.notify_all()
+        with HDF5_LOCK:
+            for handle in idle:
+                handle.close()
+
+    @contextmanager
+    def handle(self):
+        """
+        :return:
+        """
+        handle = self.acquire()
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    def close(self):
+        """
+        close all the handles
+        :return:
+        """
+        with self._condition:
+            handles = self._handles
+            self._handles = []
+            self._idle = []
+            self._generation += 1
+        with HDF5_LOCK:
+            for handle in handles:
+                handle.close()
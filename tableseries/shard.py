@@ -0,0 +1,251 @@
+# encoding:utf-8
+import collections
+import inspect
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas
+import pytz
+
+from .errors import TableSeriesError
+
+
+class ShardedStore(object):
+    """
+    the store api over a directory of hdf5 files, the names are sharded by
+    the hash of the name or the rows by the year of the local time. the shard
+    stores are opened lazily, at most max_open stores are kept open and the
+    least recently used idle store is closed. the hdf5 calls of the shard
+    stores in the process are serialized by the HDF5_LOCK, the writers of the
+    disjoint shards may append in parallel from separate processes.
+    """
+    SHARD_POLICIES = ("name", "year")
+    YEAR_REGEX = re.compile(r"^y(\d{4})\.h5$")
+
+    def __init__(self, store_class, directory, column_dtypes, *args, shard_by="name", shards=16, max_open=8,
+                 **kwargs):
+        """
+        :param store_class: TimeSeriesDayPartition, TimeSeriesMonthPartition or TimeSeriesYearPartition
+        :param directory: directory of the shard files
+        :param column_dtypes:
+        :param args: positional parameters of the shard stores after column_dtypes
+        :param shard_by: name or year
+        :param shards: number of the shard files by the name hash
+        :param max_open: max number of the open shard stores
+        :param kwargs: parameters of the shard stores
+        """
+        if shard_by not in self.SHARD_POLICIES:
+            raise ValueError("shard_by parameter must be in {0}".format(", ".join(self.SHARD_POLICIES)))
+        # the positional parameters are passed to the shard stores by their names
+        arguments = inspect.signature(store_class).bind(directory, column_dtypes, *args, **kwargs).arguments
+        kwargs = {key: value for key, value in arguments.items() if key not in ("filename", "column_dtypes")}
+        self.store_class = store_class
+        self.directory = directory
+        self.column_dtypes = column_dtypes
+        self.shard_by = shard_by
+        self.shards = shards
+        self.max_open = max_open
+        self.mode = kwargs.get("mode", "a")
+        tzinfo = kwargs.get("tzinfo", pytz.UTC)
+        self.tzinfo = pytz.timezone(tzinfo) if isinstance(tzinfo, str) else tzinfo
+        self._kwargs = kwargs
+
+        if self.mode == "a":
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        # shard filename -> store, in the least recently used order
+        self._stores = collections.OrderedDict()
+        # shard filename -> number of the uses
+        self._uses = collections.Counter()
+
+    def _name_shard(self, name):
+        """
+        :param name:
+        :return: shard filename of the name
+        """
+        shard = zlib.crc32(name.encode("utf-8")) % self.shards
+        return os.path.join(self.directory, "s{0:03d}.h5".format(shard))
+
+    def _year_shard(self, year):
+        """
+        :param year:
+        :return: shard filename of the year
+        """
+        return os.path.join(self.directory, "y{0}.h5".format(year))
+
+    def _years(self):
+        """
+        :return: sorted years of the shard files
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(search.group(1)) for search in map(self.YEAR_REGEX.search, os.listdir(self.directory))
+                      if search)
+
+    def _year(self, value):
+        """
+        the year of the local time
+        :param value: datetime
+        :return:
+        """
+        timestamp = pandas.Timestamp(value)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize(self.tzinfo)
+        return timestamp.tz_convert(self.tzinfo).year
+
+    @contextmanager
+    def _shard(self, filename):
+        """
+        the store of the shard file, the store isn't closed while it's used
+        :param filename:
+        :return: None if the shard file doesn't exist in the read only mode
+        """
+        with self._lock:
+            store = self._stores.get(filename)
+            if store is None:
+                if self.mode != "a" and not os.path.exists(filename):
+                    store = None
+                else:
+                    store = self.store_class(filename, self.column_dtypes, **self._kwargs)
+                    self._stores[filename] = store
+            if store is not None:
+                self._stores.move_to_end(filename)
+                self._uses[filename] += 1
+                self._evict()
+        try:
+            yield store
+        finally:
+            if store is not None:
+                with self._lock:
+                    self._uses[filename] -= 1
+                    self._evict()
+
+    def _evict(self):
+        """
+        close the least recently used idle stores over max_open
+        :return:
+        """
+        for filename in list(self._stores):
+            if len(self._stores) <= self.max_open:
+                break
+            if self._uses[filename] <= 0:
+                self._stores.pop(filename).close()
+                del self._uses[filename]
+
+    def _shard_files(self, name, start_year=None, end_year=None):
+        """
+        :param name:
+        :param start_year:
+        :param end_year:
+        :return: shard filenames of the name between the years in the time order
+        """
+        if self.shard_by == "name":
+            return [self._name_shard(name)]
+        return [self._year_shard(year) for year in self._years()
+                if (start_year is None or year >= start_year) and (end_year is None or year <= end_year)]
+
+    def append(self, name, data_frame, duplicates=None):
+        """
+        :param name:
+        :param data_frame:
+        :param duplicates: skip, reject or overwrite, the store policy if None
+        :return:
+        """
+        self._validate_writable()
+        if self.shard_by == "name":
+            with self._shard(self._name_shard(name)) as store:
+                store.append(name, data_frame, duplicates=duplicates)
+            return
+
+        if not isinstance(data_frame, pandas.DataFrame):
+            raise TypeError("data parameter's type must be a pandas.DataFrame")
+        if not isinstance(data_frame.index, pandas.DatetimeIndex):
+            raise TypeError("DataFrame index must be pandas.DateTimeIndex type")
+        index = data_frame.index
+        index = index.tz_localize(self.tzinfo) if index.tz is None else index.tz_convert(self.tzinfo)
+        for year in index.year.unique():
+            with self._shard(self._year_shard(year)) as store:
+                store.append(name, data_frame.loc[index.year == year], duplicates=duplicates)
+
+    def get_granularity_range(self, name, start_datetime: datetime, end_datetime: datetime = None, **kwargs):
+        """
+        :param name:
+        :param start_datetime:
+        :param end_datetime:
+        :param kwargs: columns, return_type, workers and chunk_rows of the store get_granularity_range
+        :return:
+        """
+        end_year = None if end_datetime is None else self._year(end_datetime)
+        for filename in self._shard_files(name, self._year(start_datetime), end_year):
+            with self._shard(filename) as store:
+                if store is not None:
+                    yield from store.get_granularity_range(name, start_datetime, end_datetime, **kwargs)
+
+    def length(self, name):
+        """
+        :param name:
+        :return:
+        """
+        length = 0
+        for filename in self._shard_files(name):
+            with self._shard(filename) as store:
+                if store is not None:
+                    length += store.length(name)
+        return length
+
+    def delete(self, name, year=None, month=None, day=None):
+        """
+        :param name:
+        :param year:
+        :param month:
+        :param day:
+        :return:
+        """
+        self._validate_writable()
+        for filename in self._shard_files(name, year, year):
+            with self._shard(filename) as store:
+                if store is not None and store.length(name) > 0:
+                    store.delete(name, year, month, day)
+
+    def _validate_writable(self):
+        """
+        :return:
+        """
+        if self.mode != "a":
+            raise TableSeriesError("the sharded store is read only")
+
+    def flush(self):
+        """
+        flush the open stores
+        :return:
+        """
+        with self._lock:
+            for store in self._stores.values():
+                store.flush()
+
+    def close(self):
+        """
+        close the open stores
+        :return:
+        """
+        with self._lock:
+            while self._stores:
+                _, store = self._stores.popitem(last=False)
+                store.close()
+            self._uses.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        """
+        :return:
+        """
+        return "<{0} {1} by {2}>".format(type(self).__name__, self.directory, self.shard_by)
@@ -1,7 +1,16 @@
+import bisect
+import collections
+import functools
+import multiprocessing
+import os
 import re
 import sys
 import threading
-from datetime import datetime
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
 from decimal import Decimal, ROUND_HALF_DOWN
 
 import numpy
@@ -9,7 +18,10 @@ import pandas
 import pytz
 import tables
 
-from .compare import DateCompare
+from .cache import ReadCache
+from .errors import TableSeriesError
+from .pool import HDF5_LOCK, HandlePool
+from .shard import ShardedStore
 
 
 def round_timestamp(timestamp):
@@ -21,28 +33,191 @@ def round_timestamp(timestamp):
     return int(timestamp * Decimal(1e9))
 
 
-class TableSeriesError(Exception):
-    pass
+def synchronized(func):
+    """
+    run the method under the store lock and the hdf5 lock
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._lock, HDF5_LOCK:
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+def reading(func):
+    """
+    run the method with the file handle of the current thread
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._reading():
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+# (store class, filename, column dtypes, index name, tzinfo) -> (read only store, query token)
+_WORKER_STORES = {}
+
+
+def _read_partition_task(store_key, token, name, date_key, start_timestamp, end_timestamp, columns, return_type):
+    """
+    read a partition in the worker process of the parallel range query,
+    the read only store of the process is refreshed once for every query
+    :param store_key:
+    :param token: query token
+    :param name:
+    :param date_key:
+    :param start_timestamp:
+    :param end_timestamp:
+    :param columns:
+    :param return_type:
+    :return:
+    """
+    store, store_token = _WORKER_STORES.get(store_key, (None, None))
+    if store is None:
+        store_class, filename, column_dtypes, index_name, tzinfo = store_key
+        store = store_class(filename, list(column_dtypes), index_name=index_name, tzinfo=tzinfo,
+                            mode="r", swmr=True)
+    elif store_token != token:
+        store.refresh()
+    _WORKER_STORES[store_key] = (store, token)
+
+    records = store._read_partition(name, date_key, start_timestamp, end_timestamp, columns)
+    if records is not None:
+        return store._to_result(records, return_type)
+
+
+class RecordBuffer(object):
+    """
+    preallocated structured array buffer, the capacity grows double
+    """
+
+    def __init__(self, dtype, capacity=1024):
+        """
+        :param dtype:
+        :param capacity:
+        """
+        self.records = numpy.empty(capacity, dtype=dtype)
+        self.size = 0
+        self.created = time.time()
+
+    @property
+    def nbytes(self):
+        return self.size * self.records.dtype.itemsize
+
+    def append(self, records):
+        """
+        :param records:
+        :return:
+        """
+        size = self.size + records.size
+        if size > self.records.size:
+            grown = numpy.empty(max(size, self.records.size * 2), dtype=self.records.dtype)
+            grown[:self.size] = self.records[:self.size]
+            self.records = grown
+        self.records[self.size:size] = records
+        self.size = size
+
+    def take(self):
+        """
+        :return: the buffered records
+        """
+        return self.records[:self.size]
+
+    def replace(self, records):
+        """
+        :param records: the records replacing the buffered records
+        :return:
+        """
+        self.size = 0
+        self.append(records)
+
+
+class HotPartition(object):
+    """
+    the newest partition of a name in memory, the pending records aren't
+    written into the file yet. the records and the pending records are
+    record buffers, the rows in order are appended in place.
+    """
+
+    def __init__(self, date_key, records):
+        """
+        :param date_key:
+        :param records: sorted records of the partition in the file
+        """
+        self.date_key = date_key
+        self.records = RecordBuffer(records.dtype, capacity=max(records.size, 1024))
+        self.records.append(records)
+        self.pending = RecordBuffer(records.dtype)
 
 
 class TableBase(object):
     """
+    the writes are serialized under the store lock, so are the reads of a
+    writable store. a read only store (mode="r") with thread_safe=True reads
+    on the read only file handles of a pool without the store lock. the hdf5
+    calls of all the stores in the process are serialized by the process wide
+    HDF5_LOCK, taken after the store lock, and the threads of the pooled reads
+    convert the results in parallel. the store lock is never taken under the
+    HDF5_LOCK.
+
     http://www.pytables.org/cookbook/threading.html
     https://www.pytables.org/usersguide/optimization.html?highlight=bitshuffle
     """
     DATE_FORMAT = None
     FREQ = None
     GROUP_REGEX = None
+    # max days of a partition
+    PERIOD_DAYS = None
 
     NUMBER_REGEX = re.compile(r"(\d+)")
     NAME_REGEX = re.compile(r'^([a-zA-Z]+)([0-9]*)$')
 
+    DUPLICATE_POLICIES = ("skip", "reject", "overwrite")
+    # immediate indexes on every append, deferred indexes the dirty partitions
+    # on flush and close, manual only indexes them by reindex
+    INDEX_POLICIES = ("immediate", "deferred", "manual")
+    # hdf5 group attributes of the partitions and the name
+    STATISTICS = ("nrows", "min_timestamp", "max_timestamp", "last_write")
+    # numpy returns the structured array, dict returns the column arrays,
+    # the index is int64 UTC nanoseconds
+    RETURN_TYPES = ("pandas", "numpy", "dict")
+    # aggregation -> the reductions of the partial aggregations
+    AGGREGATIONS = {"sum": ("sum",), "mean": ("sum", "count"), "min": ("min",), "max": ("max",),
+                    "first": ("first",), "last": ("last",), "count": ("count",),
+                    "ohlc": ("first", "max", "min", "last")}
+    # the rollup tables store the reductions of the numeric columns and the row count
+    ROLLUP_REDUCTIONS = ("sum", "min", "max", "first", "last")
+    DAY_NANOSECONDS = 86400 * 10 ** 9
+    # bounds of the partition table chunk size
+    MIN_CHUNK_BYTES = 16 * 1024
+    MAX_CHUNK_BYTES = 1024 * 1024
+
     def __init__(self, filename, column_dtypes, index_name="timestamp",
                  complib="blosc:blosclz",
                  in_memory=False,
                  compress_level=5,
                  bitshuffle=False,
-                 tzinfo=pytz.UTC):
+                 tzinfo=pytz.UTC,
+                 duplicates="skip",
+                 sorted_append=True,
+                 index_policy="immediate",
+                 buffer_rows=100000,
+                 buffer_bytes=None,
+                 buffer_seconds=None,
+                 mode="a",
+                 thread_safe=False,
+                 pool_size=4,
+                 swmr=False,
+                 rollups=None,
+                 cache_bytes=None,
+                 rows_per_day=None,
+                 tiers=None,
+                 hot_partition=False):
         """
         :param filename:
         :param column_dtypes:
@@ -51,6 +226,34 @@ class TableBase(object):
         :param compress_level:
         :param bitshuffle:
         :param in_memory:
+        :param tzinfo:
+        :param duplicates: policy of the rows already stored, skip, reject or overwrite
+        :param sorted_append: merge the out of order rows on append to keep the partitions sorted
+        :param index_policy: immediate, deferred or manual
+        :param buffer_rows: flush the append_buffered rows of a name at the rows
+        :param buffer_bytes: flush the append_buffered rows of a name at the bytes
+        :param buffer_seconds: flush the append_buffered rows older than the seconds
+        :param mode: a for read and write, r for read only
+        :param thread_safe: read only store reads on the pooled file handles without the store lock
+        :param pool_size: max number of the pooled read only file handles
+        :param swmr: single writer multiple readers, the writer flushes the file
+            on every write, the read only stores refresh to read the new rows and
+            partitions. the hdf5 file lock of the writer fails the opens of the
+            readers, the writer process must export HDF5_USE_FILE_LOCKING=FALSE
+            before tables is imported
+        :param rollups: frequencies of the rollup tables maintained on append,
+            like ("1min", "1h", "1D"), the frequencies must divide a day
+        :param cache_bytes: cache the decoded partitions of the reads up to the bytes
+        :param rows_per_day: expected rows a day to size the chunks of the new partitions,
+            the observed rows of the partitions are used if None
+        :param tiers: compression tiers by the partition age, sequence of
+            (age, complib, complevel) like [("7D", "blosc:zstd", 9)]. the partitions
+            older than the age since their end use the tier of the greatest age,
+            the younger partitions use complib and compress_level. retier
+            recompresses the partitions crossing the ages.
+        :param hot_partition: keep the newest partition of each name in memory, the
+            reads of the partition don't touch the file. the appended rows are
+            written into the file on the partition rollover, flush and close.
         """
         self._lock = threading.RLock()
         if in_memory:
@@ -69,28 +272,248 @@ class TableBase(object):
         self.filters = tables.Filters(complevel=compress_level,
                                       complib=complib,
                                       bitshuffle=bitshuffle)
+        # sorted (age nanoseconds, filters)
+        self.tiers = sorted((pandas.Timedelta(age).value, tables.Filters(complevel=tier_complevel,
+                                                                          complib=tier_complib,
+                                                                          bitshuffle=bitshuffle))
+                            for age, tier_complib, tier_complevel in tiers or ())
         
-        self.h5_store = tables.open_file(filename=filename, mode="a",
-        driver=driver, filters=self.filters)
+        if mode not in ("a", "r"):
+            raise ValueError("mode parameter must be in a, r")
+        # sorted rollup frequency nanoseconds
+        self.rollups = self._validate_rollups(rollups or ())
+        self.mode = mode
+        self.swmr = swmr
+        self._open_kwargs = {"filename": filename, "driver": driver}
+        self.h5_store = self._open_file()
+
+        # the file handle of the current thread for the reads
+        self._local = threading.local()
+        self._handle_pool = None
+        if thread_safe and mode == "r" and not in_memory:
+            self._handle_pool = HandlePool(filename, size=pool_size, driver=driver)
 
         self.index_name = index_name
         # index int64
         self._column_dtypes = column_dtypes
 
+        if duplicates not in self.DUPLICATE_POLICIES:
+            raise ValueError("duplicates parameter must be in {0}".format(", ".join(self.DUPLICATE_POLICIES)))
+        self.duplicates = duplicates
+        self.sorted_append = sorted_append
+
+        if index_policy not in self.INDEX_POLICIES:
+            raise ValueError("index_policy parameter must be in {0}".format(", ".join(self.INDEX_POLICIES)))
+        self.index_policy = index_policy
+        # table paths of the partitions with the dirty index
+        self._dirty_tables = set()
+
+        self.in_memory = in_memory
+        # process pool of the parallel range queries
+        self._executor = None
+        self._executor_workers = None
+
+        self.buffer_rows = buffer_rows
+        self.buffer_bytes = buffer_bytes
+        self.buffer_seconds = buffer_seconds
+        # (name, duplicates policy) -> RecordBuffer
+        self._buffers = {}
+
         # pytable table datatype.
         self._convert_dtypes = numpy.dtype([(index_name, "<i8")] + column_dtypes)
         self._table_description = self._convert_dtypes
 
+        # name -> sorted partition date tuples, build lazily
+        self._catalog = {}
+        # name -> the last record, updated by append
+        self._last_records = {}
+        self._read_cache = ReadCache(cache_bytes) if cache_bytes else None
+        self.rows_per_day = rows_per_day
+        self.hot_partition = hot_partition and mode == "a"
+        # name -> HotPartition
+        self._hot = {}
+
+        self._rollup_columns = [column for column, dtype in column_dtypes
+                                if numpy.dtype(dtype).kind in "iuf"]
+        rollup_dtypes = [(index_name, "<i8"), ("count", "<i8")]
+        for column in self._rollup_columns:
+            dtype = self._convert_dtypes[column]
+            rollup_dtypes.append((column + "_sum", {"i": "<i8", "u": "<u8", "f": "<f8"}[dtype.kind]))
+            rollup_dtypes.extend((column + "_" + reduction, dtype) for reduction in ("min", "max", "first", "last"))
+        self._rollup_dtype = numpy.dtype(rollup_dtypes)
+
+    def _open_file(self):
+        """
+        open the store file, the hdf5 file lock held by a writer in another
+        process fails the open
+        :return:
+        """
+        try:
+            with HDF5_LOCK:
+                return tables.open_file(mode=self.mode, filters=self.filters, **self._open_kwargs)
+        except tables.HDF5ExtError as error:
+            if "lock" not in str(error):
+                raise
+            raise TableSeriesError("{0} is locked by another process, the writer process must export "
+                                   "HDF5_USE_FILE_LOCKING=FALSE before tables is imported to share "
+                                   "the file".format(self._open_kwargs["filename"])) from error
+
+    @property
+    def _handle(self):
+        """
+        the file handle of the current thread, the pooled handle in the reads
+        of the thread safe read only store, otherwise the store handle
+        :return:
+        """
+        return getattr(self._local, "handle", None) or self.h5_store
+
+    @contextmanager
+    def _reading(self):
+        """
+        hold a pooled file handle for the current thread and the hdf5 lock,
+        or the store lock and the hdf5 lock if the store has no handle pool
+        :return:
+        """
+        if self._handle_pool is None:
+            with self._lock, HDF5_LOCK:
+                yield
+        elif getattr(self._local, "handle", None) is not None:
+            # nested reads of the thread
+            yield
+        else:
+            with self._handle_pool.handle() as handle:
+                self._local.handle = handle
+                try:
+                    with HDF5_LOCK:
+                        yield
+                finally:
+                    self._local.handle = None
+
+    @reading
     def length(self, name):
         """
         :param name:
         :return:
         """
-        path = "/" + name
-        total_length = 0
-        for table_node in self.h5_store.walk_nodes(path, classname="Table"):
-            total_length += table_node.nrows
-        return total_length
+        self._validate_name(name)
+        return self._series_statistics(name)["nrows"]
+
+    @reading
+    def first_datetime(self, name):
+        """
+        the first stored datetime of the name
+        :param name:
+        :return:
+        """
+        self._validate_name(name)
+        return self._to_datetime(self._series_statistics(name)["min_timestamp"])
+
+    @reading
+    def last_datetime(self, name):
+        """
+        the last stored datetime of the name
+        :param name:
+        :return:
+        """
+        self._validate_name(name)
+        return self._to_datetime(self._series_statistics(name)["max_timestamp"])
+
+    def _to_datetime(self, timestamp):
+        """
+        :param timestamp: int64 UTC nanoseconds
+        :return:
+        """
+        if timestamp is not None:
+            return pandas.Timestamp(int(timestamp), tz="UTC").tz_convert(self.tzinfo)
+
+    def _read_statistics(self, attrs):
+        """
+        :param attrs: group attributes
+        :return:
+        """
+        return {key: attrs[key] for key in self.STATISTICS}
+
+    def _write_statistics(self, group_path, statistics):
+        """
+        :param group_path:
+        :param statistics:
+        :return:
+        """
+        attrs = self.h5_store.get_node(group_path)._v_attrs
+        for key in self.STATISTICS:
+            attrs[key] = statistics[key]
+
+    def _partition_statistics(self, group_path):
+        """
+        nrows, min timestamp, max timestamp and last write time of the partition
+        from the group attributes, the table of the old files without the
+        attributes will be read.
+        :param group_path:
+        :return:
+        """
+        attrs = self._handle.get_node(group_path)._v_attrs
+        if "nrows" in attrs:
+            return self._read_statistics(attrs)
+
+        table_node = self._handle.get_node(group_path, "table", "Table")
+        statistics = {"nrows": table_node.nrows, "min_timestamp": None,
+                      "max_timestamp": None, "last_write": None}
+        if table_node.nrows > 0:
+            timestamps = table_node.col(self.index_name)
+            statistics["min_timestamp"] = timestamps.min()
+            statistics["max_timestamp"] = timestamps.max()
+        return statistics
+
+    def _name_statistics(self, name):
+        """
+        nrows, min timestamp, max timestamp and last write time of the name
+        :param name:
+        :return:
+        """
+        root_path = "/" + name
+        if root_path in self._handle:
+            attrs = self._handle.get_node(root_path)._v_attrs
+            if "nrows" in attrs:
+                return self._read_statistics(attrs)
+
+        statistics = {"nrows": 0, "min_timestamp": None, "max_timestamp": None, "last_write": None}
+        for date_key in self._partition_keys(name):
+            self._merge_statistics(statistics, self._partition_statistics(self._group_path(name, date_key)))
+        return statistics
+
+    def _series_statistics(self, name):
+        """
+        the name statistics with the rows of the hot partition
+        :param name:
+        :return:
+        """
+        statistics = self._name_statistics(name)
+        hot = self._hot.get(name)
+        if hot is None or hot.records.size == 0:
+            return statistics
+        group_path = self._group_path(name, hot.date_key)
+        stored_rows = self._partition_statistics(group_path)["nrows"] if group_path in self._handle else 0
+        timestamps = hot.records.take()[self.index_name]
+        self._merge_statistics(statistics, {"nrows": 0, "min_timestamp": timestamps[0],
+                                            "max_timestamp": timestamps[-1], "last_write": None},
+                               nrows=statistics["nrows"] - stored_rows + hot.records.size)
+        return statistics
+
+    def _merge_statistics(self, statistics, other, nrows=None):
+        """
+        merge the min, max timestamp and the last write of the other into the statistics
+        :param statistics:
+        :param other:
+        :param nrows: replace the nrows if not None, otherwise add the nrows of other
+        :return:
+        """
+        if nrows is None:
+            statistics["nrows"] += other["nrows"]
+        else:
+            statistics["nrows"] = nrows
+        for key, func in (("min_timestamp", min), ("max_timestamp", max), ("last_write", max)):
+            values = [value for value in (statistics[key], other[key]) if value is not None]
+            statistics[key] = func(values) if values else None
 
     def _validate_name(self, name):
         """
@@ -137,25 +560,297 @@ class TableBase(object):
             # create completely sorted index
             col.create_csindex()
 
-    def _get_or_create_table(self, name, parent_group_path):
+    def _index_table(self, table_node):
+        """
+        create the index or update the dirty index of the table
+        :param table_node:
+        :return:
+        """
+        if not table_node.indexed:
+            self._create_index(table_node, self.index_name)
+        else:
+            table_node.reindex_dirty()
+        table_node._v_parent._v_attrs["index_dirty"] = False
+
+    @synchronized
+    def reindex(self, name, year=None, month=None, day=None):
+        """
+        index the dirty partitions of the name under the year, month and day
+        :param name:
+        :param year:
+        :param month:
+        :param day:
+        :return: the number of the indexed partitions
+        """
+        self._validate_name(name)
+        count = 0
+        for date_key in self._prefix_keys(name, year, month, day):
+            group_path = self._group_path(name, date_key)
+            # the hot partition may be in memory only
+            if group_path not in self.h5_store:
+                continue
+            attrs = self.h5_store.get_node(group_path)._v_attrs
+            table_node = self.h5_store.get_node(group_path, "table", "Table")
+            if ("index_dirty" in attrs and attrs["index_dirty"]) or not table_node.indexed:
+                self._index_table(table_node)
+                count += 1
+            self._dirty_tables.discard(table_node._v_pathname)
+        self.h5_store.flush()
+        return count
+
+    @synchronized
+    def compact(self, name, start_datetime: datetime = None, end_datetime: datetime = None, complib=None,
+                complevel=None, repack=False):
+        """
+        rewrite the partition tables between the datetimes into the sorted,
+        indexed tables chunked for their rows, the new table replaces the old
+        table in the partition group. all the partitions if start_datetime is None.
+        :param name:
+        :param start_datetime:
+        :param end_datetime:
+        :param complib: compression library of the new tables, the complib of the partition tier if None
+        :param complevel: compression level of the new tables, the level of the partition tier if None
+        :param repack: copy the file into a new file to reclaim the space of the removed tables
+        :return: the number of the compacted partitions
+        """
+        self._validate_name(name)
+        if self.mode != "a":
+            raise TableSeriesError("compact needs the store in a mode")
+        if repack and self.in_memory:
+            raise TableSeriesError("repack isn't supported by the in memory store")
+        if start_datetime is None:
+            date_keys = list(self._partition_keys(name))
+        else:
+            start_date, end_date, _, _ = self._validate_datetime(start_datetime, end_datetime)
+            date_keys = self._range_keys(name, start_date, end_date)
+        # the buffered rows and the deferred indexes go into the new tables
+        self.flush()
+
+        count = 0
+        now = round_timestamp(time.time())
+        for date_key in date_keys:
+            group_path = self._group_path(name, date_key)
+            if group_path + "/table" in self.h5_store:
+                tier_filters = self._partition_filters(date_key, now)
+                filters = tables.Filters(complevel=tier_filters.complevel if complevel is None else complevel,
+                                         complib=complib or tier_filters.complib,
+                                         bitshuffle=tier_filters.bitshuffle)
+                self._compact_table(group_path, filters)
+                count += 1
+        self._observe_partition_rows(name, self._name_statistics(name), len(self._partition_keys(name)))
+        self.h5_store.flush()
+        if repack:
+            self._repack()
+        return count
+
+    @synchronized
+    def retier(self, name=None, repack=False):
+        """
+        recompress the partitions whose compression tier changed with their age,
+        the partitions younger than the first tier keep their compression
+        :param name: all the names if None
+        :param repack: copy the file into a new file to reclaim the space of the removed tables
+        :return: the number of the recompressed partitions
+        """
+        if self.mode != "a":
+            raise TableSeriesError("retier needs the store in a mode")
+        if repack and self.in_memory:
+            raise TableSeriesError("repack isn't supported by the in memory store")
+        if not self.tiers:
+            return 0
+        if name is None:
+            names = [group._v_name for group in self.h5_store.list_nodes("/", classname="Group")]
+        else:
+            self._validate_name(name)
+            names = [name]
+        self.flush()
+
+        count = 0
+        now = round_timestamp(time.time())
+        for name in names:
+            for date_key in self._partition_keys(name):
+                group_path = self._group_path(name, date_key)
+                if group_path + "/table" not in self.h5_store:
+                    continue
+                filters = self._partition_tier(date_key, now)
+                if filters is None:
+                    continue
+                table_filters = self.h5_store.get_node(group_path, "table", "Table").filters
+                if (table_filters.complib, table_filters.complevel) != (filters.complib, filters.complevel):
+                    self._compact_table(group_path, filters)
+                    count += 1
+        self.h5_store.flush()
+        if repack:
+            self._repack()
+        return count
+
+    def _partition_filters(self, date_key, now=None):
+        """
+        the filters of the partition tier by its age since the partition end
+        :param date_key:
+        :param now: UTC nanoseconds, the current time if None
+        :return:
+        """
+        filters = self._partition_tier(date_key, now)
+        return self.filters if filters is None else filters
+
+    def _partition_tier(self, date_key, now=None):
+        """
+        :param date_key:
+        :param now: UTC nanoseconds, the current time if None
+        :return: the filters of the partition tier, None if the partition is younger than the tiers
+        """
+        filters = None
+        if not self.tiers:
+            return filters
+        if now is None:
+            now = round_timestamp(time.time())
+        date_ = date(*(date_key + (1,) * (3 - len(date_key))))
+        end_time = pandas.Period(date_, freq=self.FREQ).end_time
+        age = now - self._local_to_timestamp(end_time.value, ambiguous=False)
+        for tier_age, tier_filters in self.tiers:
+            if age >= tier_age:
+                filters = tier_filters
+        return filters
+
+    def _compact_table(self, group_path, filters):
+        """
+        :param group_path:
+        :param filters:
+        :return:
+        """
+        table_node = self.h5_store.get_node(group_path, "table", "Table")
+        records = self._read_records(table_node)
+        expected_rows = max(records.size, 1)
+        new_node = self.h5_store.create_table(group_path, "table_compact", description=self._table_description,
+                                              filters=filters, expectedrows=expected_rows,
+                                              chunkshape=self._chunkshape(expected_rows))
+        new_node.append(records)
+        new_node.flush()
+        self._create_index(new_node, self.index_name)
+
+        # swap the tables
+        self.h5_store.rename_node(table_node, "table_old")
+        self.h5_store.rename_node(new_node, "table")
+        self.h5_store.remove_node(group_path, "table_old")
+        attrs = self.h5_store.get_node(group_path)._v_attrs
+        attrs["sorted"] = True
+        attrs["index_dirty"] = False
+        if self._read_cache is not None:
+            self._read_cache.invalidate(group_path)
+
+    def _repack(self):
+        """
+        copy the file into a new file and replace the file, the hdf5 file
+        doesn't reuse the space of the removed nodes
+        :return:
+        """
+        filename = self._open_kwargs["filename"]
+        repack_filename = filename + ".repack"
+        self.h5_store.copy_file(repack_filename, overwrite=True, propindexes=True)
+        self.h5_store.close()
+        os.replace(repack_filename, filename)
+        self.h5_store = self._open_file()
+
+    def _get_or_create_table(self, name, parent_group_path, expected_rows=None, filters=None):
         """
         :param name: table name
+        :param expected_rows: expected rows of the table sizing its chunks, the
+            pytables defaults if None
+        :param filters: the store filters if None
         :return:
         """
         table_path = parent_group_path + "/" + name
         if table_path in self.h5_store:
             data_table = self.h5_store.get_node(where=parent_group_path, name=name)
+        elif expected_rows:
+            data_table = self.h5_store.create_table(parent_group_path, name=name, description=self._table_description,
+                                                    filters=filters, expectedrows=expected_rows,
+                                                    chunkshape=self._chunkshape(expected_rows))
         else:
-            data_table = self.h5_store.create_table(parent_group_path, name=name, description=self._table_description)
+            data_table = self.h5_store.create_table(parent_group_path, name=name, description=self._table_description,
+                                                    filters=filters)
         return data_table
 
-    def _partition_date_frame(self, date_frame):
+    def _chunkshape(self, expected_rows):
+        """
+        about 1/64 of the expected partition bytes a chunk, between the chunk
+        size bounds. the large chunks compress better, the small chunks read the
+        short ranges faster.
+        :param expected_rows:
+        :return:
+        """
+        row_bytes = self._table_description.itemsize
+        chunk_bytes = min(max(expected_rows * row_bytes // 64, self.MIN_CHUNK_BYTES), self.MAX_CHUNK_BYTES)
+        return max(chunk_bytes // row_bytes, 1),
+
+    def _expected_rows(self, name, name_statistics, partitions):
+        """
+        the expected rows of a new partition from rows_per_day, or the observed
+        rows a partition persisted in the name attributes. the rate is observed
+        again from the name statistics at every new partition, the mean follows
+        the rows of the full partitions after a partial first partition
+        :param name:
+        :param name_statistics:
+        :param partitions: number of the partitions of the name
+        :return: None if unknown
+        """
+        if self.rows_per_day:
+            return int(self.rows_per_day * self.PERIOD_DAYS)
+        if partitions == 0 or not name_statistics["nrows"]:
+            return None
+        self._observe_partition_rows(name, name_statistics, partitions)
+        return self.h5_store.get_node("/" + name)._v_attrs["partition_rows"]
+
+    def _observe_partition_rows(self, name, name_statistics, partitions):
+        """
+        persist the observed rows a partition in the name attributes
+        :param name:
+        :param name_statistics:
+        :param partitions: number of the partitions of the name
+        :return:
+        """
+        if partitions and name_statistics["nrows"]:
+            attrs = self.h5_store.get_node("/" + name)._v_attrs
+            attrs["partition_rows"] = int(name_statistics["nrows"] // partitions) or None
+
+    def _frame_to_records(self, data_frame):
+        """
+        convert the data frame into one structured array of the table datatype
+        sorted by the index, the index is stored as int64 UTC nanoseconds
+        :param data_frame:
+        :return:
+        """
+        if len(data_frame.columns) != len(self._column_dtypes):
+            raise ValueError("DataFrame columns length must be {0}".format(len(self._column_dtypes)))
+
+        records = numpy.empty(data_frame.shape[0], dtype=self._convert_dtypes)
+        # tz aware index asi8 is always the UTC + 0 nanoseconds
+        records[self.index_name] = data_frame.index.asi8
+        for position, (column, _) in enumerate(self._column_dtypes):
+            records[column] = data_frame.iloc[:, position].values
+
+        if not data_frame.index.is_monotonic_increasing:
+            records = records[numpy.argsort(records[self.index_name], kind="mergesort")]
+        return records
+
+    def _partition_records(self, records):
         """
+        split sorted records by partition, yield the partition date and the slice view
+        :param records:
         :return:
         """
-        for date_key, frame in date_frame.groupby(pandas.Grouper(freq=self.FREQ)):
-            yield (date_key, frame)
+        timestamps = records[self.index_name]
+        local_index = pandas.to_datetime(timestamps, utc=True).tz_convert(self.tzinfo).tz_localize(None)
+        periods = local_index.values.astype("datetime64[{0}]".format(self.FREQ))
 
+        unique_periods = numpy.unique(periods)
+        bounds = numpy.append(numpy.searchsorted(periods, unique_periods), periods.size)
+        for period, start, stop in zip(unique_periods, bounds[:-1], bounds[1:]):
+            # datetime64[D|M|Y] -> datetime.date
+            yield period.astype(object), records[start:stop]
+
+    @synchronized
     def delete(self, name, year=None, month=None, day=None):
         """
         :param self:
@@ -180,34 +875,133 @@ class TableBase(object):
         else:
             path = root
             node = name
+        prefix = tuple(item for item in (year, month, day) if item)
+        hot = self._hot.get(name)
+        if hot is not None and hot.date_key[:len(prefix)] == prefix:
+            del self._hot[name]
+            self._last_records.pop(name, None)
+            if path.rstrip("/") + "/" + node not in self.h5_store:
+                # the rows were only in memory
+                return
+
         self.h5_store.remove_node(path, name=node, recursive=True)
         self.h5_store.flush()
 
-    def _check_repeated(self, name, data_frame):
+        if prefix and name in self._catalog:
+            self._catalog[name] = [date_key for date_key in self._catalog[name]
+                                   if date_key[:len(prefix)] != prefix]
+        else:
+            self._catalog.pop(name, None)
+        self._last_records.pop(name, None)
+        if self._read_cache is not None:
+            self._read_cache.invalidate(path.rstrip("/") + "/" + node)
+
+        if prefix:
+            # rebuild the name statistics from the left partitions
+            root_attrs = self.h5_store.get_node("/" + name)._v_attrs
+            if "nrows" in root_attrs:
+                del root_attrs.nrows
+            self._write_statistics("/" + name, self._name_statistics(name))
+            self.h5_store.flush()
+
+    def _check_repeated(self, table_node, array, duplicates, statistics):
         """
-        :param data_frame:
+        filter the records which timestamp already stored in the table,
+        only the int64 index column of the table will be read when the
+        records overlap the partition min and max timestamp
+        :param table_node:
+        :param array: sorted records
+        :param duplicates: skip, reject or overwrite
+        :param statistics: partition statistics
         :return:
         """
-        data_frame.sort_index(inplace=True)
-        datetime_index = data_frame.index
+        timestamps = array[self.index_name]
+        if statistics["nrows"] == 0 or timestamps[-1] < statistics["min_timestamp"] or \
+                timestamps[0] > statistics["max_timestamp"]:
+            return array
+
+        stored_timestamps = table_node.col(self.index_name)
+        repeated = numpy.isin(array[self.index_name], stored_timestamps, assume_unique=True)
+        if not repeated.any():
+            return array
+
+        if duplicates == "reject":
+            raise TableSeriesError("DataFrame index are already stored in {0}".format(table_node._v_pathname))
+        elif duplicates == "skip":
+            return array[~repeated]
+        else:
+            # overwrite, remove the stored rows then the new rows will be appended
+            coordinates = numpy.flatnonzero(numpy.isin(stored_timestamps, array[self.index_name],
+                                                       assume_unique=True))
+            # contiguous coordinate runs, removed from the end of the table
+            runs = numpy.split(coordinates, numpy.flatnonzero(numpy.diff(coordinates) != 1) + 1)
+            for run in reversed(runs):
+                table_node.remove_rows(run[0], run[-1] + 1)
+            return array
+
+    @reading
+    def date_groups(self, name):
+        """
+        :param name:
+        :return: sorted list of (date tuple, group path)
+        """
+        return [(date_key, self._group_path(name, date_key)) for date_key in self._partition_keys(name)]
 
-        max_datetime = datetime_index.max()
-        min_datetime = datetime_index.min()
-        max_datetime = max_datetime.to_pydatetime()
-        min_datetime = min_datetime.to_pydatetime()
+    def _date_key(self, date):
+        """
+        partition date tuple of the date, (2016,) (2016, 1) or (2016, 1, 2)
+        :param date:
+        :return:
+        """
+        return (date.year, date.month, date.day)[:self.GROUP_REGEX.groups]
 
-        for filter_frame in self.get_granularity_range(name, min_datetime, max_datetime):
-            if filter_frame is not None and not filter_frame.empty:
-                data_frame = data_frame.drop(filter_frame.index)
-        return data_frame
+    def _group_path(self, name, date_key):
+        """
+        :param name:
+        :param date_key: partition date tuple
+        :return: /APPL/y2016/m01/d02
+        """
+        date_tuple = date_key + (1,) * (3 - len(date_key))
+        return "/" + name + "/" + date(*date_tuple).strftime(self.DATE_FORMAT)
 
-    def date_groups(self, name):
+    def _partition_keys(self, name):
         """
+        sorted partition date tuples of the name, the hdf5 groups are only walked
+        at the first time, append and delete keep the catalog updated. the walk
+        holds the hdf5 lock only, the pooled reads call it under the hdf5 lock
         :param name:
         :return:
         """
-        root_path = "/" + name
-        return self._walk_groups(root_path, self.GROUP_REGEX)
+        if name not in self._catalog:
+            with HDF5_LOCK:
+                if name not in self._catalog:
+                    root_path = "/" + name
+                    date_keys = []
+                    if root_path in self._handle:
+                        date_keys = sorted(date_key for date_key, _ in self._walk_groups(root_path,
+                                                                                        self.GROUP_REGEX))
+                    self._catalog[name] = date_keys
+        return self._catalog[name]
+
+    def _prefix_keys(self, name, year=None, month=None, day=None):
+        """
+        partition date tuples under the year, month and day
+        :param name:
+        :param year:
+        :param month:
+        :param day:
+        :return:
+        """
+        date_keys = self._partition_keys(name)
+        hot = self._hot.get(name)
+        if hot is not None and (not date_keys or hot.date_key > date_keys[-1]):
+            date_keys = date_keys + [hot.date_key]
+        prefix = tuple(item for item in (year, month, day) if item)
+        start = bisect.bisect_left(date_keys, prefix)
+        end = start
+        while end < len(date_keys) and date_keys[end][:len(prefix)] == prefix:
+            end += 1
+        return date_keys[start:end]
 
     def _validate_datetime(self, start_datetime, end_datetime):
         """
@@ -241,15 +1035,42 @@ class TableBase(object):
 
         return start_date, end_date, start_timestamp, end_timestamp
 
-    def append(self, name, data_frame):
+    @synchronized
+    def append(self, name, data_frame, duplicates=None):
         """
         append data frame data into datatable
         :param name:
         :param data_frame:
+        :param duplicates: override the duplicates policy of the store
         :return:
         """
         self._validate_name(name)
+        if self.mode != "a":
+            raise TableSeriesError("append needs the store in a mode")
+        duplicates = self._validate_duplicates(duplicates)
+        self._validate_frame(data_frame)
+
+        self._append(name, self._frame_to_records(data_frame), duplicates)
+        if self.swmr:
+            # the readers refresh to the flushed file
+            self.h5_store.flush()
+
+    def _validate_duplicates(self, duplicates):
+        """
+        :param duplicates: None for the duplicates policy of the store
+        :return:
+        """
+        duplicates = duplicates or self.duplicates
+        if duplicates not in self.DUPLICATE_POLICIES:
+            raise ValueError("duplicates parameter must be in {0}".format(", ".join(self.DUPLICATE_POLICIES)))
+        return duplicates
 
+    def _validate_frame(self, data_frame):
+        """
+        validate the data frame and convert the index timezone
+        :param data_frame:
+        :return:
+        """
         if not isinstance(data_frame, pandas.DataFrame):
             raise TypeError("data parameter's type must be a pandas.DataFrame")
         if not isinstance(data_frame.index, pandas.DatetimeIndex):
@@ -269,27 +1090,375 @@ class TableBase(object):
         if duplicated_index.size > 0:
             raise TableSeriesError("DataFrame index are duplicated")
 
-        data_frame = self._check_repeated(name, data_frame)
+    def _append(self, name, records, duplicates):
+        """
+        append the records into the hot partition and the file
+        :param name:
+        :param records:
+        :param duplicates:
+        :return: the number of the written rows
+        """
+        if duplicates == "reject":
+            # a rejected append writes nothing
+            self._reject_repeated(name, records)
+        if not self.hot_partition:
+            return self._append_records(name, records, duplicates)
+
+        written = 0
+        for partition_date, array in self._partition_records(records):
+            date_key = self._date_key(partition_date)
+            hot = self._hot.get(name)
+            if hot is not None and date_key > hot.date_key:
+                # the partition rollover
+                self._spill(name)
+                del self._hot[name]
+                hot = None
+            date_keys = self._partition_keys(name)
+            if hot is None and (not date_keys or date_key >= date_keys[-1]):
+                hot = self._hot[name] = self._load_hot(name, date_key)
+            if hot is not None and date_key == hot.date_key:
+                written += self._append_hot(name, hot, array, duplicates)
+            else:
+                written += self._append_records(name, array, duplicates)
+        return written
 
-        for date_key, chunk_frame in self._partition_date_frame(data_frame):
-            date_group = date_key.strftime(self.DATE_FORMAT)
-            group_path = "/" + name + "/" + date_group
-            self._create_group_path(group_path)
+    def _reject_repeated(self, name, records):
+        """
+        raise if any stored partition or the hot partition has the timestamps
+        of the records, before any partition is written
+        :param name:
+        :param records: sorted records
+        :return:
+        """
+        hot = self._hot.get(name)
+        for partition_date, array in self._partition_records(records):
+            date_key = self._date_key(partition_date)
+            group_path = self._group_path(name, date_key)
+            if hot is not None and date_key == hot.date_key:
+                if self._sorted_repeated(hot.records.take()[self.index_name], array[self.index_name]).any():
+                    raise TableSeriesError("DataFrame index are already stored in {0}".format(group_path))
+            elif group_path + "/table" in self.h5_store:
+                self._check_repeated(self.h5_store.get_node(group_path, "table", "Table"), array, "reject",
+                                     self._partition_statistics(group_path))
+
+    def _load_hot(self, name, date_key):
+        """
+        :param name:
+        :param date_key:
+        :return: the hot partition with the rows of the partition in the file
+        """
+        group_path = self._group_path(name, date_key)
+        if group_path + "/table" in self.h5_store:
+            records = self._read_records(self.h5_store.get_node(group_path, "table", "Table"))
+        else:
+            records = numpy.empty(0, dtype=self._convert_dtypes)
+        return HotPartition(date_key, records)
 
-            array = chunk_frame.to_records(index=True)
-            numpy_dtypes = numpy.dtype([(self.index_name, "<M8[ns]")] + self._column_dtypes)
+    def _sorted_repeated(self, stored_timestamps, timestamps):
+        """
+        :param stored_timestamps: sorted unique timestamps
+        :param timestamps: sorted timestamps
+        :return: the mask of the timestamps in the stored timestamps
+        """
+        if stored_timestamps.size == 0:
+            return numpy.zeros(timestamps.size, dtype=bool)
+        positions = numpy.minimum(numpy.searchsorted(stored_timestamps, timestamps), stored_timestamps.size - 1)
+        return stored_timestamps[positions] == timestamps
 
-            array = array.astype(numpy.dtype(numpy_dtypes))
-            # default timezone is UTC + 0
-            array = numpy.rec.array(array, dtype=self._convert_dtypes)
+    def _append_hot(self, name, hot, array, duplicates):
+        """
+        append the sorted records of the partition into the hot partition, the
+        rows after the last hot row are appended in place, only the out of
+        order rows are merged with the hot rows
+        :param name:
+        :param hot:
+        :param array:
+        :param duplicates:
+        :return: the number of the written rows
+        """
+        timestamps = array[self.index_name]
+        records = hot.records.take()
+        if records.size == 0 or timestamps[0] > records[self.index_name][-1]:
+            hot.records.append(array)
+            hot.pending.append(array)
+        else:
+            repeated = self._sorted_repeated(records[self.index_name], timestamps)
+            pending = hot.pending.take()
+            if repeated.any():
+                if duplicates == "reject":
+                    raise TableSeriesError("DataFrame index are already stored in {0}".format(
+                        self._group_path(name, hot.date_key)))
+                elif duplicates == "skip":
+                    array = array[~repeated]
+                else:
+                    records = records[~self._sorted_repeated(timestamps, records[self.index_name])]
+                    pending = pending[~self._sorted_repeated(timestamps, pending[self.index_name])]
+            if array.size == 0:
+                return 0
+            hot.records.replace(self._sort_records(numpy.concatenate((records, array))))
+            hot.pending.replace(self._sort_records(numpy.concatenate((pending, array))))
+
+        cached = self._last_records.get(name)
+        if cached is not None and array[-1][self.index_name] >= cached[self.index_name]:
+            self._last_records[name] = array[-1].copy()
+        return array.size
+
+    def _spill(self, name):
+        """
+        write the pending records of the hot partition into the file
+        :param name:
+        :return:
+        """
+        hot = self._hot[name]
+        if hot.pending.size > 0:
+            # the pending rows replace the rows in the file
+            self._append_records(name, hot.pending.take(), "overwrite")
+            hot.pending.size = 0
+
+    def _hot_records(self, name, date_key):
+        """
+        :param name:
+        :param date_key:
+        :return: the records of the hot partition, None if the partition isn't hot
+        """
+        hot = self._hot.get(name)
+        if hot is not None and hot.date_key == date_key:
+            return hot.records.take()
+        return None
+
+    def _slice_records(self, records, start_timestamp=None, end_timestamp=None, columns=None):
+        """
+        the sorted records between the timestamps, copied
+        :param records:
+        :param start_timestamp:
+        :param end_timestamp:
+        :param columns:
+        :return:
+        """
+        timestamps = records[self.index_name]
+        start, stop = 0, records.size
+        if start_timestamp is not None:
+            start = numpy.searchsorted(timestamps, start_timestamp, side="left")
+        if end_timestamp is not None:
+            stop = numpy.searchsorted(timestamps, end_timestamp, side="right")
+        dtype = self._projected_dtype(columns)
+        result = numpy.empty(max(stop - start, 0), dtype=dtype)
+        for field in dtype.names:
+            result[field] = records[field][start:stop]
+        return result
+
+    def _append_records(self, name, records, duplicates):
+        """
+        append the sorted records without duplicated index into the partitions
+        :param name:
+        :param records:
+        :param duplicates: skip, reject or overwrite
+        :return: the number of the written rows
+        """
+        date_keys = self._partition_keys(name)
+        name_statistics = self._name_statistics(name)
+        written = 0
+
+        for partition_date, array in self._partition_records(records):
+            date_key = self._date_key(partition_date)
+            group_path = self._group_path(name, date_key)
+
+            if group_path + "/table" in self.h5_store:
+                table_node = self.h5_store.get_node(group_path, "table", "Table")
+                statistics = self._partition_statistics(group_path)
+                array = self._check_repeated(table_node, array, duplicates, statistics)
+                if array.size == 0:
+                    continue
+            else:
+                expected_rows = self._expected_rows(name, name_statistics, len(date_keys))
+                self._create_group_path(group_path)
+                table_node = self._get_or_create_table("table", group_path, expected_rows,
+                                                       self._partition_filters(date_key))
+                statistics = {"nrows": 0, "min_timestamp": None, "max_timestamp": None, "last_write": None}
+                if date_key not in date_keys:
+                    bisect.insort(date_keys, date_key)
+            previous = dict(statistics)
+            self._write_records(table_node, array, statistics)
+            written += array.size
+            if self._read_cache is not None:
+                self._read_cache.invalidate(group_path)
+
+            # the statistics follow the written rows before the rollups and the
+            # index, a failed append keeps the partition and the name in step
+            self._merge_statistics(statistics, {"nrows": 0,
+                                                "min_timestamp": array[self.index_name][0],
+                                                "max_timestamp": array[self.index_name][-1],
+                                                "last_write": round_timestamp(time.time())},
+                                   nrows=table_node.nrows)
+            self._write_statistics(group_path, statistics)
+            self._merge_statistics(name_statistics, statistics,
+                                   nrows=name_statistics["nrows"] + statistics["nrows"] - previous["nrows"])
+            self._write_statistics("/" + name, name_statistics)
+            cached = self._last_records.get(name)
+            if cached is not None and array[-1][self.index_name] >= cached[self.index_name]:
+                self._last_records[name] = array[-1].copy()
+
+            # flush the appended rows into the index
+            table_node.flush()
+            if self.rollups:
+                self._update_rollups(table_node, array, previous, statistics)
+
+            if self.index_policy == "immediate":
+                self._index_table(table_node)
+            else:
+                table_node.autoindex = False
+                table_node._v_parent._v_attrs["index_dirty"] = True
+                self._dirty_tables.add(table_node._v_pathname)
+        return written
 
-            table_node = self._get_or_create_table("table", group_path)
+    def _write_records(self, table_node, array, statistics):
+        """
+        append the sorted records into the partition table. the rows after the
+        stored rows are appended directly, the out of order rows of a sorted
+        partition are merged with the stored rows after the first appended
+        timestamp so the partition keeps sorted.
+        :param table_node:
+        :param array: sorted records
+        :param statistics: partition statistics before the append
+        :return:
+        """
+        attrs = table_node._v_parent._v_attrs
+        timestamps = array[self.index_name]
+        if table_node.nrows == 0 or timestamps[0] > statistics["max_timestamp"]:
+            if table_node.nrows == 0:
+                attrs["sorted"] = True
             table_node.append(array)
+        elif self.sorted_append and self._is_sorted(table_node):
+            position = self._search_sorted(table_node, timestamps[0])
+            merged = numpy.concatenate((table_node.read(position), array))
+            merged = merged[numpy.argsort(merged[self.index_name], kind="mergesort")]
+            # the index can't follow the truncated rows, it will be created again
+            if table_node.indexed:
+                getattr(table_node.cols, self.index_name).remove_index()
+            table_node.truncate(position)
+            table_node.append(merged)
+        else:
+            attrs["sorted"] = False
+            table_node.append(array)
+
+    def _validate_rollups(self, rollups):
+        """
+        :param rollups:
+        :return: sorted frequency nanoseconds
+        """
+        levels = set()
+        for rollup in rollups:
+            level = self._freq_nanoseconds(rollup)
+            if level % 10 ** 9 != 0 or self.DAY_NANOSECONDS % level != 0:
+                raise ValueError("rollup frequency {0} must be whole seconds dividing a day".format(rollup))
+            levels.add(level)
+        return sorted(levels)
+
+    def _rollup_node_name(self, level):
+        """
+        :param level: rollup frequency nanoseconds
+        :return:
+        """
+        return "rollup_{0}s".format(level // 10 ** 9)
+
+    def _rollup_level(self, freq_value, columns):
+        """
+        the coarsest rollup dividing the freq
+        :param freq_value:
+        :param columns:
+        :return: None if no rollup fits
+        """
+        if not set(columns) <= set(self._rollup_columns):
+            return None
+        levels = [level for level in self.rollups if freq_value % level == 0]
+        return levels[-1] if levels else None
+
+    def _rollup_current(self, rollup_node, statistics):
+        """
+        the rollup table was updated with the last write of the partition, the
+        stores without the rollups append the rows without updating them
+        :param rollup_node:
+        :param statistics: partition statistics
+        :return:
+        """
+        attrs = rollup_node.attrs
+        return "partition_nrows" in attrs and attrs["partition_nrows"] == statistics["nrows"] \
+            and attrs["partition_write"] == statistics["last_write"]
 
-            if not table_node.indexed:
-                self._create_index(table_node, self.index_name)
+    def _update_rollups(self, table_node, records, statistics, current):
+        """
+        update the rollup tables of the partition after the append. the rows
+        after the stored rows are merged into the last rollup rows, otherwise the
+        rollup rows of the touched bins are reduced again from the partition rows.
+        the rollup tables are the siblings of the partition table, the rollup
+        bins never cross the partitions. the stale rollup tables are built
+        again from the partition rows.
+        :param table_node:
+        :param records: the appended sorted records
+        :param statistics: partition statistics before the append
+        :param current: partition statistics after the append
+        :return:
+        """
+        group_path = table_node._v_parent._v_pathname
+        timestamps = records[self.index_name]
+        appended = statistics["nrows"] == 0 or timestamps[0] > statistics["max_timestamp"]
+        local_timestamps = self._local_nanoseconds(timestamps)
+        for level in self.rollups:
+            rollup_path = group_path + "/" + self._rollup_node_name(level)
+            low, high = local_timestamps.min() // level, local_timestamps.max() // level
+            if rollup_path in self.h5_store and statistics["nrows"] > 0 \
+                    and not self._rollup_current(self.h5_store.get_node(rollup_path), statistics):
+                self.h5_store.remove_node(rollup_path)
+            if rollup_path not in self.h5_store:
+                rollup_node = self.h5_store.create_table(group_path, self._rollup_node_name(level),
+                                                         description=self._rollup_dtype)
+                if statistics["nrows"] > 0:
+                    # the partition rows appended before the rollup was configured
+                    raw = self._read_records(table_node, columns=self._rollup_columns)
+                    low, high = None, None
+                else:
+                    raw = records
+            elif appended:
+                rollup_node = self.h5_store.get_node(rollup_path)
+                raw = records
             else:
-                table_node.reindex_dirty()
+                rollup_node = self.h5_store.get_node(rollup_path)
+                # the local time offset changes less than a day in a partition
+                raw = self._read_records(table_node, timestamps[0] - level - self.DAY_NANOSECONDS,
+                                         timestamps[-1] + level + self.DAY_NANOSECONDS, self._rollup_columns)
+                raw_bins = self._local_nanoseconds(raw[self.index_name]) // level
+                raw = raw[(raw_bins >= low) & (raw_bins <= high)]
+
+            position = 0
+            stored = numpy.empty(0, dtype=self._rollup_dtype)
+            if low is not None:
+                position = self._search_sorted(rollup_node, low * level)
+                stored = rollup_node.read(position)
+                if not appended:
+                    # the touched bins are reduced again
+                    stored = stored[stored[self.index_name] // level > high]
+
+            bins = numpy.concatenate((stored[self.index_name] // level,
+                                      self._local_nanoseconds(raw[self.index_name]) // level))
+            partials = {(self.index_name, "count"): numpy.concatenate((stored["count"],
+                                                                       numpy.ones(raw.size, dtype="<i8")))}
+            for column in self._rollup_columns:
+                for reduction in self.ROLLUP_REDUCTIONS:
+                    partials[(column, reduction)] = numpy.concatenate((stored[column + "_" + reduction],
+                                                                       raw[column]))
+            bins, partials = self._sorted_partials(bins, partials)
+
+            rows = numpy.empty(bins.size, dtype=self._rollup_dtype)
+            rows[self.index_name] = bins * level
+            rows["count"] = partials[(self.index_name, "count")]
+            for column in self._rollup_columns:
+                for reduction in self.ROLLUP_REDUCTIONS:
+                    rows[column + "_" + reduction] = partials[(column, reduction)]
+            rollup_node.truncate(position)
+            rollup_node.append(rows)
+            rollup_node.attrs["partition_nrows"] = current["nrows"]
+            rollup_node.attrs["partition_write"] = current["last_write"]
+            rollup_node.flush()
 
     def _walk_groups(self, root_path, regex):
         """
@@ -299,7 +1468,7 @@ class TableBase(object):
         :return:
         """
         group_list = []
-        for group_path in self.h5_store.walk_groups(root_path):
+        for group_path in self._handle.walk_groups(root_path):
             path_name = group_path._v_pathname
             search = regex.search(path_name)
             if search:
@@ -331,81 +1500,361 @@ class TableBase(object):
             data_frame.sort_index(inplace=True)
         return data_frame
 
-    def _read_where(self, table_node, where_filter):
+    def _projected_dtype(self, columns=None):
+        """
+        the datatype of the index and the selected columns
+        :param columns:
+        :return:
+        """
+        if columns is None:
+            return self._convert_dtypes
+        for column in columns:
+            if column == self.index_name or column not in self._convert_dtypes.names:
+                raise ValueError("column {0} not in the table columns".format(column))
+        return numpy.dtype([(self.index_name, "<i8")] + [(column, self._convert_dtypes[column])
+                                                         for column in columns])
+
+    def _sort_records(self, records):
+        """
+        sort the records by the index in place
+        :param records:
+        :return:
+        """
+        timestamps = records[self.index_name]
+        if (timestamps[1:] < timestamps[:-1]).any():
+            records[:] = records[numpy.argsort(timestamps, kind="mergesort")]
+        return records
 
-        result = table_node.read_where(where_filter)
-        return self._to_pandas_frame(result, sort=True)
+    def _is_sorted(self, table_node):
+        """
+        the partition rows are stored in the index order
+        :param table_node:
+        :return:
+        """
+        attrs = table_node._v_parent._v_attrs
+        return "sorted" in attrs and bool(attrs["sorted"])
 
-    def _read_table(self, table_node):
+    def _search_sorted(self, table_node, timestamp, side="left", start=0):
         """
+        binary search the row position of the timestamp in the sorted table,
+        one index field is read each step
         :param table_node:
+        :param timestamp:
+        :param side: left or right like numpy.searchsorted
+        :param start:
         :return:
         """
-        result = table_node.read_sorted(sortby=self.index_name)
-        return self._to_pandas_frame(result)
+        low, high = start, table_node.nrows
+        while low < high:
+            middle = (low + high) // 2
+            value = table_node.read(middle, middle + 1, field=self.index_name)[0]
+            if value < timestamp or (side == "right" and value == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
 
-    def _get_granularity(self, name, year=None, month=None, day=None):
+    def _row_range(self, table_node, start_timestamp=None, end_timestamp=None):
         """
-        :param name:
-        :param year:
-        :param month:
-        :param day:
+        the row positions of the table between the timestamps
+        :param table_node:
+        :param start_timestamp:
+        :param end_timestamp:
+        :return: (start, stop), None if the bounded table isn't sorted
+        """
+        if start_timestamp is None and end_timestamp is None:
+            return 0, table_node.nrows
+        if not self._is_sorted(table_node):
+            return None
+        start = 0
+        if start_timestamp is not None:
+            start = self._search_sorted(table_node, start_timestamp)
+        stop = table_node.nrows
+        if end_timestamp is not None:
+            stop = self._search_sorted(table_node, end_timestamp, side="right", start=start)
+        return start, stop
+
+    def _read_rows(self, table_node, start, stop, columns=None, out=None):
+        """
+        read the contiguous rows of the table, the rows are stored together so
+        the rows are read once and the index and the selected columns are copied.
+        :param table_node:
+        :param start:
+        :param stop:
+        :param columns: selected columns, all the columns if None
+        :param out: structured array with stop - start length
         :return:
         """
-        self._validate_name(name)
-        root = "/" + name
+        dtype = self._projected_dtype(columns)
+        if out is None:
+            out = numpy.empty(stop - start, dtype=dtype)
+        if out.size == 0:
+            return out
+        if columns is None:
+            # sequential read into the buffer
+            table_node.read(start, stop, out=out)
+        else:
+            records = table_node.read(start, stop)
+            for field in dtype.names:
+                out[field] = records[field]
+        return out
 
-        if year and month and day:
-            path = root + "/y{year}/m{month:02d}/d{day:02d}".format(year=year, month=month, day=day)
-        elif year and month:
-            path = root + "/y{year}/m{month:02d}".format(year=year, month=month)
-        elif year:
-            path = root + "/y{year}".format(year=year)
+    def _read_records(self, table_node, start_timestamp=None, end_timestamp=None, columns=None, out=None):
+        """
+        read the table rows between the timestamps sorted by the index.
+        the sorted partitions are read contiguously between the binary searched
+        positions, the others by the where condition.
+        :param table_node:
+        :param start_timestamp: read from the table start if None
+        :param end_timestamp: read until the table end if None
+        :param columns: selected columns, all the columns if None
+        :param out: structured array with table_node.nrows length for the whole table
+        :return:
+        """
+        row_range = self._row_range(table_node, start_timestamp, end_timestamp)
+        if row_range is not None:
+            records = self._read_rows(table_node, row_range[0], row_range[1], columns, out)
+            if self._is_sorted(table_node):
+                return records
+            return self._sort_records(records)
+
+        records = table_node.read_where(self._where_condition(start_timestamp, end_timestamp))
+        if columns is not None:
+            records = self._project_records(records, columns)
+        return self._sort_records(records)
+
+    def _where_condition(self, start_timestamp=None, end_timestamp=None):
+        """
+        :param start_timestamp:
+        :param end_timestamp:
+        :return: where condition of the index between the timestamps
+        """
+        conditions = []
+        if start_timestamp is not None:
+            conditions.append("( {index_name} >= {start_timestamp} )".format(index_name=self.index_name,
+                                                                             start_timestamp=start_timestamp))
+        if end_timestamp is not None:
+            conditions.append("( {index_name} <= {end_timestamp} )".format(index_name=self.index_name,
+                                                                           end_timestamp=end_timestamp))
+        return " & ".join(conditions)
+
+    def _sorted_coordinates(self, table_node, start_timestamp=None, end_timestamp=None):
+        """
+        the row coordinates of the unsorted table between the timestamps in the
+        index order, only the index field of the selected rows is read
+        :param table_node:
+        :param start_timestamp:
+        :param end_timestamp:
+        :return:
+        """
+        if start_timestamp is None and end_timestamp is None:
+            coordinates = numpy.arange(table_node.nrows, dtype=numpy.int64)
+            timestamps = table_node.col(self.index_name)
         else:
-            path = root
-        return path
+            coordinates = table_node.get_where_list(self._where_condition(start_timestamp, end_timestamp),
+                                                    sort=True)
+            timestamps = table_node.read_coordinates(coordinates, field=self.index_name)
+        return coordinates[numpy.argsort(timestamps, kind="mergesort")]
+
+    def _project_records(self, records, columns):
+        """
+        copy the index and the selected columns of the records
+        :param records:
+        :param columns:
+        :return:
+        """
+        dtype = self._projected_dtype(columns)
+        result = numpy.empty(records.size, dtype=dtype)
+        for field in dtype.names:
+            result[field] = records[field]
+        return result
+
+    def _to_result(self, records, return_type):
+        """
+        :param records: sorted structured array
+        :param return_type: pandas data frame, numpy structured array or dict of column arrays
+        :return:
+        """
+        if return_type == "pandas":
+            return self._to_pandas_frame(records)
+        elif return_type == "numpy":
+            return records
+        else:
+            return {field: numpy.ascontiguousarray(records[field]) for field in records.dtype.names}
+
+    def _validate_return_type(self, return_type):
+        """
+        :param return_type:
+        :return:
+        """
+        if return_type not in self.RETURN_TYPES:
+            raise ValueError("return_type parameter must be in {0}".format(", ".join(self.RETURN_TYPES)))
+
+    def _iter_tables(self, name, date_keys):
+        """
+        :param name:
+        :param date_keys:
+        :return:
+        """
+        for date_key in date_keys:
+            yield self._handle.get_node(self._group_path(name, date_key), "table", "Table")
 
-    def get_granularity(self, name, year=None, month=None, day=None):
+    @reading
+    def get_granularity(self, name, year=None, month=None, day=None, columns=None, return_type="pandas"):
         """
         :param name:
         :param year:
         :param month:
         :param day:
+        :param columns: selected columns, all the columns if None
+        :param return_type: pandas, numpy or dict
         :return:
         """
-        path = self._get_granularity(name, year, month, day)
-
-        result = numpy.empty(shape=0, dtype=self._convert_dtypes)
-        for table_node in self.h5_store.walk_nodes(path, classname="Table"):
-            sorted_data = table_node.read_sorted(sortby=self.index_name)
-            result = numpy.concatenate((result, sorted_data))
+        self._validate_name(name)
+        self._validate_return_type(return_type)
+
+        date_keys = self._prefix_keys(name, year, month, day)
+        hot_records = self._hot_records(name, date_keys[-1]) if date_keys else None
+        if hot_records is not None:
+            date_keys = date_keys[:-1]
+        table_nodes = list(self._iter_tables(name, date_keys))
+
+        # allocate the result once and read each partition into its slice
+        result = numpy.empty(sum(table_node.nrows for table_node in table_nodes)
+                             + (0 if hot_records is None else hot_records.size),
+                             dtype=self._projected_dtype(columns))
+        offset = 0
+        for table_node in table_nodes:
+            if self._cacheable(table_node, columns):
+                result[offset:offset + table_node.nrows] = self._cached_records(table_node, columns)
+            else:
+                self._read_records(table_node, columns=columns, out=result[offset:offset + table_node.nrows])
+            offset += table_node.nrows
+        if hot_records is not None:
+            result[offset:] = self._slice_records(hot_records, columns=columns)
         if result.size > 0:
-            return self._to_pandas_frame(result)
+            return self._to_result(result, return_type)
 
-    def get_granularity_iter(self, name, year=None, month=None, day=None):
+    def get_granularity_iter(self, name, year=None, month=None, day=None, columns=None, return_type="pandas",
+                             chunk_rows=None):
         """
         :param name:
         :param year:
         :param month:
         :param day:
+        :param columns: selected columns, all the columns if None
+        :param return_type: pandas, numpy or dict
+        :param chunk_rows: yield the partitions in the chunks of at most chunk_rows
+            rows, the whole partitions if None
         :return:
         """
-        path = self._get_granularity(name, year, month, day)
-        for table_node in self.h5_store.walk_nodes(path, classname="Table"):
-            yield self._read_table(table_node)
+        self._validate_name(name)
+        self._validate_return_type(return_type)
+        self._validate_chunk_rows(chunk_rows)
+        self._projected_dtype(columns)
+        for date_key in self._prefix_keys(name, year, month, day):
+            if chunk_rows is not None:
+                for records in self._read_partition_chunks(name, date_key, columns=columns, chunk_rows=chunk_rows):
+                    yield self._to_result(records, return_type)
+                continue
+            records = self._read_partition(name, date_key, columns=columns)
+            if records is not None:
+                yield self._to_result(records, return_type)
+
+    def _validate_chunk_rows(self, chunk_rows):
+        """
+        :param chunk_rows:
+        :return:
+        """
+        if chunk_rows is not None and (not isinstance(chunk_rows, int) or chunk_rows <= 0):
+            raise ValueError("chunk_rows must be a positive integer")
 
-    def _get_granularity_range_table(self, name, start_date, end_date=None):
+    @reading
+    def tail(self, name, n=5, columns=None, return_type="pandas"):
+        """
+        the last n rows, read from the end of the newest partition and the
+        partitions before it only if it has less than n rows
+        :param name:
+        :param n:
+        :param columns: selected columns, all the columns if None
+        :param return_type: pandas, numpy or dict
+        :return: None if the name has no rows
+        """
         self._validate_name(name)
-        root = "/"
-        root_path = root + name
-        group_list = self._walk_groups(root_path, self.GROUP_REGEX)
+        self._validate_return_type(return_type)
+        self._projected_dtype(columns)
+
+        parts = []
+        remaining = n
+        for date_key in reversed(self._prefix_keys(name)):
+            if remaining <= 0:
+                break
+            hot_records = self._hot_records(name, date_key)
+            if hot_records is not None:
+                records = self._slice_records(hot_records[-remaining:], columns=columns)
+                parts.append(records)
+                remaining -= records.size
+                continue
+            group_path = self._group_path(name, date_key)
+            if group_path not in self._handle:
+                continue
+            table_node = self._handle.get_node(group_path, "table", "Table")
+            if self._is_sorted(table_node):
+                records = self._read_rows(table_node, max(table_node.nrows - remaining, 0), table_node.nrows,
+                                          columns)
+            else:
+                records = self._read_records(table_node, columns=columns)[-remaining:]
+            parts.append(records)
+            remaining -= records.size
 
-        result_groups = self._filter_groups(group_list, start_date, end_date)
+        if n > 0 and parts:
+            records = numpy.concatenate(parts[::-1]) if len(parts) > 1 else parts[0]
+            return self._to_result(records, return_type)
 
-        for result in result_groups:
-            # result[0] -> (2016, 1, 2)
-            # result[1] -> /APPL/y2016/m01/d02
-            yield result[0], self.h5_store.get_node(result[1], "table", "Table")
+    @reading
+    def last(self, name, columns=None, return_type="pandas"):
+        """
+        the last row, cached per name and updated by append
+        :param name:
+        :param columns: selected columns, all the columns if None
+        :param return_type: pandas, numpy or dict
+        :return: None if the name has no rows
+        """
+        self._validate_name(name)
+        self._validate_return_type(return_type)
+        dtype = self._projected_dtype(columns)
+
+        record = self._last_records.get(name)
+        if record is None:
+            records = self.tail(name, 1, return_type="numpy")
+            if records is None:
+                return None
+            record = self._last_records[name] = records[0]
+        result = numpy.empty(1, dtype=dtype)
+        for field in dtype.names:
+            result[field] = record[field]
+        return self._to_result(result, return_type)
+
+    def _range_keys(self, name, start_date, end_date=None):
+        """
+        select the partitions between the start date and the end date from the catalog
+        :param name:
+        :param start_date:
+        :param end_date:
+        :return: date tuples, (2016, 1, 2)
+        """
+        self._validate_name(name)
+        date_keys = self._partition_keys(name)
+
+        hot = self._hot.get(name)
+        if hot is not None and (not date_keys or hot.date_key > date_keys[-1]):
+            date_keys = date_keys + [hot.date_key]
+
+        start = bisect.bisect_left(date_keys, self._date_key(start_date))
+        end = len(date_keys)
+        if end_date:
+            end = bisect.bisect_right(date_keys, self._date_key(end_date))
+        return date_keys[start:end]
 
     def __enter__(self):
         return self
@@ -419,94 +1868,772 @@ class TableBase(object):
         """
         return repr(self.h5_store)
 
-    def close(self):
+    @synchronized
+    def append_buffered(self, name, data_frame, duplicates=None):
+        """
+        append the data frame into the write buffer of the name, the buffered
+        rows are not readable and not durable until they are flushed.
+        the buffer is flushed when the rows, bytes or age limit is reached.
+        :param name:
+        :param data_frame:
+        :param duplicates: override the duplicates policy of the store
+        :return: the written rows of the flushed names, empty if nothing flushed
+        """
+        self._validate_name(name)
+        if self.mode != "a":
+            raise TableSeriesError("append needs the store in a mode")
+        duplicates = self._validate_duplicates(duplicates)
+        self._validate_frame(data_frame)
+
+        key = (name, duplicates)
+        if key not in self._buffers:
+            self._buffers[key] = RecordBuffer(self._convert_dtypes)
+        record_buffer = self._buffers[key]
+        record_buffer.append(self._frame_to_records(data_frame))
+
+        now = time.time()
+        flush_keys = [buffer_key for buffer_key, buffer_item in self._buffers.items()
+                      if self.buffer_seconds is not None and now - buffer_item.created >= self.buffer_seconds]
+        if (self.buffer_rows is not None and record_buffer.size >= self.buffer_rows) or \
+                (self.buffer_bytes is not None and record_buffer.nbytes >= self.buffer_bytes):
+            flush_keys.append(key)
+
+        flushed = {}
+        for buffer_key in set(flush_keys):
+            buffer_name, _ = buffer_key
+            flushed[buffer_name] = flushed.get(buffer_name, 0) + self._flush_buffer(buffer_key)
+        return flushed
+
+    def _flush_buffer(self, key):
+        """
+        append the buffered records of the name through the bulk append path,
+        the buffer is kept when the append fails
+        :param key: (name, duplicates policy)
+        :return: the number of the written rows
+        """
+        name, duplicates = key
+        records = self._sort_records(self._buffers[key].take())
+
+        timestamps = records[self.index_name]
+        if duplicates == "reject":
+            if (timestamps[1:] == timestamps[:-1]).any():
+                raise TableSeriesError("buffered index are duplicated")
+        elif duplicates == "skip":
+            # keep the first buffered row of the index
+            records = records[numpy.append(True, timestamps[1:] != timestamps[:-1])]
+        else:
+            # keep the last buffered row of the index
+            records = records[numpy.append(timestamps[1:] != timestamps[:-1], True)]
+
+        written = self._append(name, records, duplicates)
+        del self._buffers[key]
+        if self.swmr:
+            self.h5_store.flush()
+        return written
+
+    @synchronized
+    def flush(self):
+        """
+        flush the write buffers and the file, the deferred index policy indexes
+        the dirty partitions. all the rows appended before are durable after
+        flush returns. a failed write buffer is kept and the first error is
+        raised after the other buffers are flushed.
+        :return: the written rows of the write buffer names
+        """
+        flushed = {}
+        error = None
+        for key in list(self._buffers):
+            name, _ = key
+            try:
+                flushed[name] = flushed.get(name, 0) + self._flush_buffer(key)
+            except Exception as exception:
+                error = error or exception
+        for name in self._hot:
+            self._spill(name)
+
+        if self.index_policy == "deferred":
+            for table_path in sorted(self._dirty_tables):
+                # the partition may be deleted
+                if table_path in self.h5_store:
+                    self._index_table(self.h5_store.get_node(table_path))
+            self._dirty_tables.clear()
+        self.h5_store.flush()
+        if error is not None:
+            raise error
+        return flushed
+
+    @synchronized
+    def refresh(self):
         """
+        reopen the file to read the rows and partitions flushed by the writer
+        since the store opened, the catalog is built again.
         :return:
         """
+        if self._handle_pool is not None:
+            self._handle_pool.reset()
         self.h5_store.close()
+        self.h5_store = self._open_file()
+        self._catalog = {}
+        self._last_records = {}
+        if self._read_cache is not None:
+            self._read_cache.clear()
 
-    def _format_date(self, *date_tuple):
+    @synchronized
+    def close(self):
         """
         :return:
         """
-        if self.FREQ == "D":
-            return DateCompare(date_tuple[0], date_tuple[1], date_tuple[2])
-        elif self.FREQ == "M":
-            return DateCompare(date_tuple[0], date_tuple[1])
-        else:
-            return DateCompare(date_tuple[0])
-
-    def _filter_groups(self, group_list, start_dt, end_dt=None):
+        try:
+            if self.h5_store.isopen:
+                self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            if self._handle_pool is not None:
+                self._handle_pool.close()
+            self.h5_store.close()
+
+    def get_granularity_range(self, name, start_datetime: datetime, end_datetime: datetime = None, columns=None,
+                              return_type="pandas", workers=None, chunk_rows=None):
         """
-        :param group_list:
-        :param start_dt:
-        :param end_dt:
+        :param name:
+        :param start_datetime:
+        :param end_datetime:
+        :param columns: selected columns, all the columns if None
+        :param return_type: pandas, numpy or dict
+        :param workers: number of the worker processes or a process executor to
+            read the partitions in parallel, each worker opens the file read only.
+            the workers of a writable store need HDF5_USE_FILE_LOCKING=FALSE in
+            the environment to open the file locked by the store
+        :param chunk_rows: yield the partitions in the chunks of at most chunk_rows
+            rows in the time order, the sorted partitions are paged by the row
+            positions and only a chunk is in memory. the whole partitions if None
         :return:
         """
-        results = []
-        start_date_cmp = self._format_date(start_dt.year, start_dt.month, start_dt.day)
-        end_date_cmp = None
+        self._validate_return_type(return_type)
+        self._validate_chunk_rows(chunk_rows)
+        if workers is not None and chunk_rows is not None:
+            raise ValueError("workers and chunk_rows parameters can't be used together")
+        self._projected_dtype(columns)
 
-        if end_dt:
-            end_date_cmp = self._format_date(end_dt.year, end_dt.month, end_dt.day)
+        start_date, end_date, start_timestamp, end_timestamp = self._validate_datetime(start_datetime, end_datetime)
 
-        for date_group in group_list:
-            date_tuple = date_group[0]
-            date_tuple_cmp = self._format_date(*date_tuple)
+        date_keys = self._range_keys(name, start_date, end_date)
+        if workers is not None:
+            results = self._parallel_read(workers, name, date_keys, start_timestamp, end_timestamp,
+                                          columns, return_type)
+            for result in results:
+                if result is not None:
+                    yield result
+            return
+
+        for date_key in date_keys:
+            if chunk_rows is not None:
+                for records in self._read_partition_chunks(name, date_key, start_timestamp, end_timestamp, columns,
+                                                           chunk_rows):
+                    yield self._to_result(records, return_type)
+                continue
+            records = self._read_partition(name, date_key, start_timestamp, end_timestamp, columns)
+            if records is not None:
+                yield self._to_result(records, return_type)
+
+    def get_ranges(self, name, start_datetimes, end_datetimes, columns=None, return_type="pandas",
+                   window_column=None):
+        """
+        read the rows of many windows at once, the windows are grouped by the
+        partitions and each partition is read once between the first window start
+        and the last window end in the partition
+        :param name:
+        :param start_datetimes: window start datetimes
+        :param end_datetimes: window end datetimes, inclusive
+        :param columns: selected columns, all the columns if None
+        :param return_type: pandas, numpy or dict
+        :param window_column: return a result of all the windows rows with the
+            window position column of the name if not None
+        :return: list of the window results, None for the windows without rows
+        """
+        self._validate_name(name)
+        self._validate_return_type(return_type)
+        dtype = self._projected_dtype(columns)
+        if window_column is not None and window_column in dtype.names:
+            raise ValueError("window_column {0} is already a column".format(window_column))
+
+        starts = self._window_timestamps(start_datetimes)
+        ends = self._window_timestamps(end_datetimes)
+        if starts.size != ends.size:
+            raise ValueError("start_datetimes and end_datetimes must have the same length")
+        if (ends < starts).any():
+            raise ValueError("start datetime > end datetime in the windows")
+
+        # the partition of the window bounds by the local time
+        unit = "datetime64[{0}]".format(self.FREQ)
+        date_keys = self._prefix_keys(name)
+        key_periods = numpy.array([datetime(*(date_key + (1, 1))[:3]) for date_key in date_keys],
+                                  dtype=unit).astype(numpy.int64)
+        lows = numpy.searchsorted(key_periods, self._window_periods(starts, unit), side="left")
+        highs = numpy.searchsorted(key_periods, self._window_periods(ends, unit), side="right")
+
+        # the partitions covered by any window
+        coverage = numpy.zeros(len(date_keys) + 1, dtype=numpy.int64)
+        numpy.add.at(coverage, lows, 1)
+        numpy.add.at(coverage, highs, -1)
+
+        parts = [[] for _ in range(starts.size)]
+        for position in numpy.flatnonzero(numpy.cumsum(coverage)[:-1] > 0):
+            windows = numpy.flatnonzero((lows <= position) & (position < highs))
+            records = self._read_partition(name, date_keys[position], starts[windows].min(), ends[windows].max(),
+                                           columns)
+            if records is None or records.size == 0:
+                continue
+            timestamps = records[self.index_name]
+            bounds = zip(numpy.searchsorted(timestamps, starts[windows], side="left"),
+                         numpy.searchsorted(timestamps, ends[windows], side="right"))
+            for window, (start, stop) in zip(windows, bounds):
+                if stop > start:
+                    parts[window].append(records[start:stop])
+
+        window_records = [numpy.concatenate(part) if part else None for part in parts]
+        if window_column is None:
+            return [None if records is None else self._to_result(records, return_type)
+                    for records in window_records]
+
+        result = numpy.empty(sum(records.size for records in window_records if records is not None),
+                             dtype=dtype.descr + [(window_column, "<i8")])
+        offset = 0
+        for window, records in enumerate(window_records):
+            if records is None:
+                continue
+            for field in dtype.names:
+                result[field][offset:offset + records.size] = records[field]
+            result[window_column][offset:offset + records.size] = window
+            offset += records.size
+        if result.size > 0:
+            return self._to_result(result, return_type)
 
-            if date_tuple_cmp >= start_date_cmp and end_dt is None:
-                results.append(date_group)  # path name
-            elif end_dt and start_date_cmp <= date_tuple_cmp <= end_date_cmp:
-                results.append(date_group)  # path name
-        return results
+    def _window_timestamps(self, values):
+        """
+        the UTC nanoseconds of the datetimes rounded to the microseconds like round_timestamp,
+        the naive datetimes are in the store timezone
+        :param values:
+        :return:
+        """
+        index = pandas.DatetimeIndex(values)
+        if index.tz is None:
+            index = index.tz_localize(self.tzinfo)
+        timestamps = index.asi8
+        # round half down
+        return (timestamps + 499) // 1000 * 1000
+
+    def _window_periods(self, timestamps, unit):
+        """
+        :param timestamps: UTC nanoseconds
+        :param unit: datetime64 partition unit
+        :return: partition periods of the local time
+        """
+        return self._local_nanoseconds(timestamps).view("datetime64[ns]").astype(unit).astype(numpy.int64)
 
-    def get_granularity_range(self, name, start_datetime: datetime, end_datetime: datetime = None):
+    def _get_executor(self, workers):
         """
+        :param workers: number of the worker processes or an executor
+        :return:
+        """
+        if isinstance(workers, Executor):
+            return workers
+        with self._lock:
+            if self._executor is None or self._executor_workers != workers:
+                if self._executor is not None:
+                    self._executor.shutdown()
+                # the forked processes inherit the opened pytables files
+                self._executor = ProcessPoolExecutor(max_workers=workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+                self._executor_workers = workers
+            return self._executor
+
+    def _parallel_read(self, workers, name, date_keys, start_timestamp, end_timestamp, columns, return_type):
+        """
+        fan out the partitions to the worker processes, the results are in the
+        partition order
+        :param workers:
         :param name:
-        :param start_datetime:
-        :param end_datetime:
+        :param date_keys:
+        :param start_timestamp:
+        :param end_timestamp:
+        :param columns:
+        :param return_type:
+        :return:
+        """
+        if self.in_memory:
+            raise TableSeriesError("in memory store can't read in the worker processes")
+        if self.mode == "a" and os.environ.get("HDF5_USE_FILE_LOCKING", "").upper() != "FALSE":
+            # the worker processes inherit the environment and read it before tables is imported
+            raise TableSeriesError("the worker processes can't open the file locked by the writable store, "
+                                   "export HDF5_USE_FILE_LOCKING=FALSE or read with a read only store")
+        executor = self._get_executor(workers)
+        # the workers read the file, write the buffered and the hot rows
+        if self.mode == "a":
+            self.flush()
+
+        store_key = (type(self), self._open_kwargs["filename"], tuple(self._column_dtypes),
+                     self.index_name, self.tzinfo)
+        token = uuid.uuid4().hex
+        # bound the read results waiting for the consumer
+        max_pending = 2 * (workers if isinstance(workers, int) else os.cpu_count() or 1)
+        pending = collections.deque()
+        for date_key in date_keys:
+            pending.append(executor.submit(_read_partition_task, store_key, token, name, date_key,
+                                           start_timestamp, end_timestamp, columns, return_type))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _partition_bounds(self, group_path, start_timestamp=None, end_timestamp=None):
+        """
+        the read bounds of the partition from the partition statistics, the
+        bound covering the whole partition is None
+        :param group_path:
+        :param start_timestamp:
+        :param end_timestamp:
+        :return: (lower, upper), None if the partition has no rows in the range
+        """
+        # the partition may be deleted
+        if group_path not in self._handle:
+            return None
+        statistics = self._partition_statistics(group_path)
+        if statistics["nrows"] == 0:
+            return None
+        if start_timestamp is not None and statistics["max_timestamp"] < start_timestamp:
+            return None
+        if end_timestamp is not None and statistics["min_timestamp"] > end_timestamp:
+            return None
+
+        lower, upper = None, None
+        if start_timestamp is not None and statistics["min_timestamp"] < start_timestamp:
+            lower = start_timestamp
+        if end_timestamp is not None and statistics["max_timestamp"] > end_timestamp:
+            upper = end_timestamp
+        return lower, upper
+
+    def _read_partition(self, name, date_key, start_timestamp=None, end_timestamp=None, columns=None):
+        """
+        read the partition rows between the timestamps
+        :param name:
+        :param date_key:
+        :param start_timestamp:
+        :param end_timestamp:
+        :param columns:
+        :return: sorted records, None if the partition has no rows in the range
+        """
+        group_path = self._group_path(name, date_key)
+        with self._reading():
+            hot_records = self._hot_records(name, date_key)
+            if hot_records is not None:
+                return self._slice_records(hot_records, start_timestamp, end_timestamp, columns)
+            bounds = self._partition_bounds(group_path, start_timestamp, end_timestamp)
+            if bounds is None:
+                return None
+            table_node = self._handle.get_node(group_path, "table", "Table")
+            if not self._cacheable(table_node, columns):
+                return self._read_records(table_node, bounds[0], bounds[1], columns)
+            records = self._cached_records(table_node, columns)
+
+        timestamps = records[self.index_name]
+        start, stop = 0, records.size
+        if bounds[0] is not None:
+            start = numpy.searchsorted(timestamps, bounds[0], side="left")
+        if bounds[1] is not None:
+            stop = numpy.searchsorted(timestamps, bounds[1], side="right")
+        return records[start:stop].copy()
+
+    def _cacheable(self, table_node, columns=None):
+        """
+        the partitions over the cache bytes are never cached, their reads
+        stay bounded by the timestamps
+        :param table_node:
+        :param columns:
         :return:
         """
+        if self._read_cache is None:
+            return False
+        return table_node.nrows * self._projected_dtype(columns).itemsize <= self._read_cache.max_bytes
 
-        start_date, end_date, start_timestamp, end_timestamp = self._validate_datetime(start_datetime, end_datetime)
-        start_date_cmp = self._format_date(start_date.year, start_date.month, start_date.day)
-        end_date_cmp = None
-        if end_date:
-            end_date_cmp = self._format_date(end_date.year, end_date.month, end_date.day)
-        if "/" + name in self.h5_store:
-            for group, table_node in self._get_granularity_range_table(name, start_date, end_date):
+    def _cached_records(self, table_node, columns=None):
+        """
+        the sorted records of the whole partition from the read cache, the
+        partition is read and cached on a miss
+        :param table_node:
+        :param columns:
+        :return: the cached records, not to be modified
+        """
+        key = (table_node._v_parent._v_pathname, None if columns is None else tuple(columns))
+        records = self._read_cache.get(key)
+        if records is None:
+            records = self._read_records(table_node, columns=columns)
+            self._read_cache.put(key, records)
+        return records
+
+    def cache_info(self):
+        """
+        :return: hits, misses, entries, nbytes and max_bytes of the read cache,
+            None if the store has no read cache
+        """
+        if self._read_cache is not None:
+            return self._read_cache.info()
 
-                group_date_cmp = self._format_date(*group)
-                if end_date is None:
-                    if group_date_cmp == start_date_cmp:
+    def _read_partition_chunks(self, name, date_key, start_timestamp=None, end_timestamp=None, columns=None,
+                               chunk_rows=100000):
+        """
+        read the partition rows between the timestamps in the chunks of chunk_rows,
+        the sorted partitions are paged by the row positions, the unsorted
+        partitions by the row coordinates in the index order.
+        :param name:
+        :param date_key:
+        :param start_timestamp:
+        :param end_timestamp:
+        :param columns:
+        :param chunk_rows:
+        :return: sorted records chunks
+        """
+        group_path = self._group_path(name, date_key)
+        with self._reading():
+            hot_records = self._hot_records(name, date_key)
+            bounds = (None, None)
+            if hot_records is None:
+                bounds = self._partition_bounds(group_path, start_timestamp, end_timestamp)
+            if bounds is None:
+                return
+            row_range, coordinates = None, None
+            if hot_records is not None:
+                records = self._slice_records(hot_records, start_timestamp, end_timestamp, columns)
+            else:
+                table_node = self._handle.get_node(group_path, "table", "Table")
+                if self._is_sorted(table_node):
+                    row_range = self._row_range(table_node, bounds[0], bounds[1])
+                else:
+                    coordinates = self._sorted_coordinates(table_node, bounds[0], bounds[1])
+
+        if hot_records is not None:
+            for start in range(0, records.size, chunk_rows):
+                yield records[start:start + chunk_rows]
+            return
+
+        if row_range is not None:
+            start, stop = row_range
+        else:
+            start, stop = 0, coordinates.size
+        for position in range(start, stop, chunk_rows):
+            with self._reading():
+                # the partition may be deleted between the chunks
+                if group_path not in self._handle:
+                    return
+                table_node = self._handle.get_node(group_path, "table", "Table")
+                if row_range is not None:
+                    chunk = self._read_rows(table_node, position, min(position + chunk_rows, stop), columns)
+                else:
+                    # read the chunk rows in the file order and sort them back into the index order
+                    chunk = table_node.read_coordinates(numpy.sort(coordinates[position:position + chunk_rows]))
+                    if columns is not None:
+                        chunk = self._project_records(chunk, columns)
+                    chunk = self._sort_records(chunk)
+            yield chunk
+
+    def get_aggregate(self, name, start_datetime: datetime, end_datetime: datetime = None, freq="1D",
+                      aggs=None, chunk_rows=100000, rollups=True):
+        """
+        aggregate the rows between the datetimes into the freq bins of the local
+        time, the partitions are read in the chunks of chunk_rows and reduced with
+        numpy, only the aggregated bins are kept in memory. the bins without rows
+        are not returned. the coarsest rollup dividing the freq is read instead
+        of the rows, only the rows at the range edges are read.
+        :param name:
+        :param start_datetime:
+        :param end_datetime:
+        :param freq: fixed frequency, 5min, 1h, 1D
+        :param aggs: column -> aggregation or list of the aggregations,
+            sum, mean, min, max, first, last, count or ohlc
+        :param chunk_rows:
+        :param rollups: read the rollups of the store
+        :return: data frame of {column}_{aggregation} columns, ohlc as
+            {column}_open, {column}_high, {column}_low and {column}_close
+        """
+        freq_value = self._freq_nanoseconds(freq)
+        aggs = self._validate_aggs(aggs)
+        columns = list(aggs)
+        reductions = {(column, reduction) for column, functions in aggs.items()
+                      for function in functions for reduction in self.AGGREGATIONS[function]}
 
-                        where_filter = "( {index_name} >= {start_timestamp} )".format(index_name=self.index_name,
-                                                                                      start_timestamp=start_timestamp)
-                        yield self._read_where(table_node, where_filter)
-                    else:
-                        yield self._read_table(table_node)
+        start_date, end_date, start_timestamp, end_timestamp = self._validate_datetime(start_datetime, end_datetime)
+        date_keys = self._range_keys(name, start_date, end_date)
+        level = self._rollup_level(freq_value, columns) if rollups else None
+        if level is None:
+            pieces = self._raw_pieces(name, date_keys, start_timestamp, end_timestamp, columns, reductions,
+                                      freq_value, chunk_rows)
+        else:
+            pieces = self._rollup_pieces(name, date_keys, start_timestamp, end_timestamp, columns, reductions,
+                                         freq_value, chunk_rows, level)
+        bins, partials = self._combine_pieces(pieces, reductions)
+        return self._aggregate_frame(bins, partials, aggs, freq_value)
 
-                elif end_date and start_date_cmp == end_date_cmp:
+    def _combine_pieces(self, pieces, reductions):
+        """
+        reduce the pieces of the partial aggregations in the time order, the
+        last bin of a piece is carried into the next piece which may continue it
+        :param pieces: iterable of (bins, partials)
+        :param reductions:
+        :return: (bins, partials)
+        """
+        bins, partials = [], []
+        carry = None
+        for piece_bins, piece_partials in pieces:
+            if carry is not None:
+                piece_bins = numpy.append(carry[0], piece_bins)
+                piece_partials = {key: numpy.append(carry[1][key], values)
+                                  for key, values in piece_partials.items()}
+            piece_bins, piece_partials = self._reduce_partials(piece_bins, piece_partials)
+            bins.append(piece_bins[:-1])
+            partials.append({key: values[:-1] for key, values in piece_partials.items()})
+            carry = (piece_bins[-1:], {key: values[-1:] for key, values in piece_partials.items()})
+        if carry is not None:
+            bins.append(carry[0])
+            partials.append(carry[1])
+
+        result_bins = numpy.concatenate(bins) if bins else numpy.empty(0, dtype="<i8")
+        result_partials = {key: numpy.concatenate([partial[key] for partial in partials]) if partials
+                           else numpy.empty(0) for key in reductions}
+        return self._sorted_partials(result_bins, result_partials)
+
+    def _sorted_partials(self, bins, partials):
+        """
+        reduce the partial aggregations of the bins not in order
+        :param bins:
+        :param partials:
+        :return:
+        """
+        if (bins[1:] <= bins[:-1]).any():
+            # the local time repeats at the end of the daylight saving time
+            order = numpy.argsort(bins, kind="mergesort")
+            return self._reduce_partials(bins[order], {key: values[order] for key, values in partials.items()})
+        return bins, partials
+
+    def _raw_pieces(self, name, date_keys, start_timestamp, end_timestamp, columns, reductions, freq_value,
+                    chunk_rows, level=None, low=None, high=None):
+        """
+        the partial aggregations of the partition rows between the timestamps
+        :param name:
+        :param date_keys:
+        :param start_timestamp:
+        :param end_timestamp:
+        :param columns:
+        :param reductions:
+        :param freq_value:
+        :param chunk_rows:
+        :param level: only the rows of the level bins between low and high if not None
+        :param low:
+        :param high:
+        :return: iterator of (bins, partials)
+        """
+        for date_key in date_keys:
+            for chunk in self._read_partition_chunks(name, date_key, start_timestamp, end_timestamp,
+                                                     columns, chunk_rows):
+                local_timestamps = self._local_nanoseconds(chunk[self.index_name])
+                if level is not None:
+                    level_bins = local_timestamps // level
+                    keep = numpy.ones(chunk.size, dtype=bool)
+                    if low is not None:
+                        keep &= level_bins >= low
+                    if high is not None:
+                        keep &= level_bins <= high
+                    chunk, local_timestamps = chunk[keep], local_timestamps[keep]
+                if chunk.size == 0:
+                    continue
+                yield local_timestamps // freq_value, self._raw_partials(chunk, reductions)
+
+    def _rollup_pieces(self, name, date_keys, start_timestamp, end_timestamp, columns, reductions, freq_value,
+                       chunk_rows, level):
+        """
+        the partial aggregations of the rollup rows of the level bins inside
+        the range, and of the raw rows of the level bins at the range edges
+        :param name:
+        :param date_keys:
+        :param start_timestamp:
+        :param end_timestamp:
+        :param columns:
+        :param reductions:
+        :param freq_value:
+        :param chunk_rows:
+        :param level:
+        :return: iterator of (bins, partials)
+        """
+        # the first and the last level bins covered by the range
+        low = -(-self._local_nanoseconds([start_timestamp])[0] // level)
+        high = None
+        if end_timestamp is not None:
+            high = (self._local_nanoseconds([end_timestamp])[0] + 1) // level - 1
+            if low > high:
+                yield from self._raw_pieces(name, date_keys, start_timestamp, end_timestamp, columns, reductions,
+                                            freq_value, chunk_rows)
+                return
+
+        head_timestamp = self._local_to_timestamp(low * level, ambiguous=False) - 1
+        if end_timestamp is not None:
+            head_timestamp = min(head_timestamp, end_timestamp)
+        if head_timestamp >= start_timestamp:
+            yield from self._raw_pieces(name, date_keys, start_timestamp, head_timestamp, columns, reductions,
+                                        freq_value, chunk_rows, level, high=low - 1)
+        for date_key in date_keys:
+            yield from self._rollup_partition_pieces(name, date_key, start_timestamp, end_timestamp, columns,
+                                                     reductions, freq_value, chunk_rows, level, low, high)
+        if end_timestamp is not None:
+            tail_timestamp = max(self._local_to_timestamp((high + 1) * level, ambiguous=True), start_timestamp)
+            if tail_timestamp <= end_timestamp:
+                yield from self._raw_pieces(name, date_keys, tail_timestamp, end_timestamp, columns, reductions,
+                                            freq_value, chunk_rows, level, low=high + 1)
+
+    def _rollup_partition_pieces(self, name, date_key, start_timestamp, end_timestamp, columns, reductions,
+                                 freq_value, chunk_rows, level, low, high):
+        """
+        the partial aggregations of the partition rollup rows between the level
+        bins, the partitions without the current rollup table and the hot
+        partitions are read raw
+        :return: iterator of (bins, partials)
+        """
+        group_path = self._group_path(name, date_key)
+        rollup_path = group_path + "/" + self._rollup_node_name(level)
+        with self._reading():
+            hot_records = self._hot_records(name, date_key)
+            if hot_records is None and group_path not in self._handle:
+                return
+            rows = None
+            # the rollup rows of the hot partition miss the pending rows
+            if hot_records is None and rollup_path in self._handle and \
+                    self._rollup_current(self._handle.get_node(rollup_path), self._partition_statistics(group_path)):
+                rollup_node = self._handle.get_node(rollup_path)
+                start = self._search_sorted(rollup_node, low * level)
+                stop = rollup_node.nrows
+                if high is not None:
+                    stop = self._search_sorted(rollup_node, high * level, side="right", start=start)
+                rows = rollup_node.read(start, stop)
+
+        if rows is None:
+            yield from self._raw_pieces(name, [date_key], start_timestamp, end_timestamp, columns, reductions,
+                                        freq_value, chunk_rows, level, low, high)
+        elif rows.size > 0:
+            partials = {(column, reduction): rows["count" if reduction == "count" else column + "_" + reduction]
+                        for column, reduction in reductions}
+            yield rows[self.index_name] // freq_value, partials
+
+    def _freq_nanoseconds(self, freq):
+        """
+        :param freq:
+        :return:
+        """
+        try:
+            freq_value = pandas.Timedelta(freq).value
+        except ValueError:
+            raise ValueError("freq must be a fixed frequency like 5min, 1h or 1D")
+        if freq_value <= 0:
+            raise ValueError("freq must be a fixed frequency like 5min, 1h or 1D")
+        return freq_value
+
+    def _validate_aggs(self, aggs):
+        """
+        :param aggs:
+        :return: column -> list of the aggregations
+        """
+        if not aggs:
+            raise ValueError("aggs parameter must be column -> aggregations")
+        result = {}
+        for column, functions in aggs.items():
+            if isinstance(functions, str):
+                functions = [functions]
+            for function in functions:
+                if function not in self.AGGREGATIONS:
+                    raise ValueError("aggregation must be in {0}".format(", ".join(self.AGGREGATIONS)))
+            result[column] = list(functions)
+        self._projected_dtype(list(result))
+        return result
+
+    def _local_nanoseconds(self, timestamps):
+        """
+        the UTC nanoseconds as the nanoseconds of the local time
+        :param timestamps:
+        :return:
+        """
+        return pandas.to_datetime(timestamps, utc=True).tz_convert(self.tzinfo).tz_localize(None).asi8
 
-                    where_filter = "( {index_name} >= {start_timestamp} ) & " \
-                                   "( {index_name} <= {end_timestamp} )".format(index_name=self.index_name,
-                                                                                start_timestamp=start_timestamp,
-                                                                                end_timestamp=end_timestamp)
-                    yield self._read_where(table_node, where_filter)
+    def _local_to_timestamp(self, local_nanoseconds, ambiguous):
+        """
+        the UTC nanoseconds of the local time, the times skipped by the daylight
+        saving time are shifted forward
+        :param local_nanoseconds:
+        :param ambiguous: True for the daylight saving time of the repeated times
+        :return:
+        """
+        return pandas.Timestamp(local_nanoseconds).tz_localize(self.tzinfo, ambiguous=ambiguous,
+                                                               nonexistent="shift_forward").value
 
-                elif end_date and start_date_cmp < end_date_cmp:
-                    if group_date_cmp == start_date_cmp:
-                        where_filter = "( {index_name} >= {start_timestamp} )".format(index_name=self.index_name,
-                                                                                      start_timestamp=start_timestamp)
-                        yield self._read_where(table_node, where_filter)
+    def _raw_partials(self, records, reductions):
+        """
+        the rows as the partial aggregations
+        :param records:
+        :param reductions: set of (column, reduction)
+        :return:
+        """
+        partials = {}
+        for column, reduction in reductions:
+            if reduction == "count":
+                partials[(column, reduction)] = numpy.ones(records.size, dtype="<i8")
+            else:
+                partials[(column, reduction)] = records[column]
+        return partials
 
-                    elif group_date_cmp == end_date_cmp:
-                        where_filter = "( {index_name} <= {end_timestamp} )".format(index_name=self.index_name,
-                                                                                    end_timestamp=end_timestamp)
+    def _reduce_partials(self, bins, partials):
+        """
+        reduce the partial aggregations of the same sorted bins
+        :param bins:
+        :param partials: (column, reduction) -> values
+        :return:
+        """
+        starts = numpy.flatnonzero(numpy.append(True, bins[1:] != bins[:-1]))
+        ends = numpy.append(starts[1:], bins.size) - 1
+        result = {}
+        for (column, reduction), values in partials.items():
+            if reduction in ("sum", "count"):
+                result[(column, reduction)] = numpy.add.reduceat(values, starts)
+            elif reduction == "min":
+                result[(column, reduction)] = numpy.minimum.reduceat(values, starts)
+            elif reduction == "max":
+                result[(column, reduction)] = numpy.maximum.reduceat(values, starts)
+            elif reduction == "first":
+                result[(column, reduction)] = values[starts]
+            else:
+                result[(column, reduction)] = values[ends]
+        return bins[starts], result
 
-                        yield self._read_where(table_node, where_filter)
-                    else:
-                        yield self._read_table(table_node)
+    def _aggregate_frame(self, bins, partials, aggs, freq_value):
+        """
+        :param bins:
+        :param partials:
+        :param aggs:
+        :param freq_value:
+        :return:
+        """
+        # the bin repeated at the end of the daylight saving time is labeled by its first occurrence
+        index = pandas.DatetimeIndex(bins * freq_value).tz_localize(self.tzinfo,
+                                                                    ambiguous=numpy.ones(bins.size, dtype=bool),
+                                                                    nonexistent="shift_forward")
+        data = collections.OrderedDict()
+        for column, functions in aggs.items():
+            for function in functions:
+                if function == "mean":
+                    data[column + "_mean"] = partials[(column, "sum")] / partials[(column, "count")]
+                elif function == "ohlc":
+                    for label, reduction in (("open", "first"), ("high", "max"), ("low", "min"), ("close", "last")):
+                        data[column + "_" + label] = partials[(column, reduction)]
+                else:
+                    data[column + "_" + function] = partials[(column, function)]
+        return pandas.DataFrame(data, index=index)
 
 
 class TimeSeriesDayPartition(TableBase):
@@ -515,6 +2642,7 @@ class TimeSeriesDayPartition(TableBase):
     """
     DATE_FORMAT = "y%Y/m%m/d%d"
     FREQ = "D"
+    PERIOD_DAYS = 1
     GROUP_REGEX = re.compile(r"/y(\d{4})/m(\d{2})/d(\d{2})")
 
 
@@ -524,6 +2652,7 @@ class TimeSeriesMonthPartition(TableBase):
     """
     DATE_FORMAT = "y%Y/m%m"
     FREQ = "M"
+    PERIOD_DAYS = 31
     GROUP_REGEX = re.compile(r"/y(\d{4})/m(\d{2})")
 
 
@@ -533,6 +2662,7 @@ class TimeSeriesYearPartition(TableBase):
     """
     DATE_FORMAT = "y%Y"
     FREQ = "Y"
+    PERIOD_DAYS = 366
     GROUP_REGEX = re.compile(r"/y(\d{4})")
 
 
@@ -540,12 +2670,25 @@ class TableSeries(object):
     """
     """
 
-    def __new__(cls, cls_name, filename, column_dtypes, *args, **kwargs):
+    def __new__(cls, cls_name, filename, column_dtypes, *args, shard_by=None, shards=16, max_open=8, **kwargs):
+        """
+        :param cls_name: year, month or day
+        :param filename: the directory of the shard files if shard_by isn't None
+        :param column_dtypes:
+        :param shard_by: shard the store into the files by the name hash or the year, name or year
+        :param shards: number of the shard files by the name hash
+        :param max_open: max number of the open shard files
+        :return:
+        """
         if cls_name not in ["year", "month", "day"]:
             raise TableSeriesError("class name parameter must be in year, month or day")
         if cls_name == "year":
-            return TimeSeriesYearPartition(filename, column_dtypes, *args, **kwargs)
+            store_class = TimeSeriesYearPartition
         elif cls_name == "month":
-            return TimeSeriesMonthPartition(filename, column_dtypes, *args, **kwargs)
+            store_class = TimeSeriesMonthPartition
         else:
-            return TimeSeriesDayPartition(filename, column_dtypes, *args, **kwargs)
+            store_class = TimeSeriesDayPartition
+        if shard_by is not None:
+            return ShardedStore(store_class, filename, column_dtypes, *args, shard_by=shard_by, shards=shards,
+                                max_open=max_open, **kwargs)
+        return store_class(filename, column_dtypes, *args, **kwargs)
@@ -1,14 +1,21 @@
 # encoding:utf-8
+import asyncio
 import itertools
 import os
+import shutil
+import subprocess
+import sys
+import threading
 import unittest
 from datetime import datetime, timedelta
+from unittest import mock
 
 import numpy
 import pandas
 import pytz
 
-from tableseries.ts import TableSeriesError
+from tableseries.aio import AsyncTableSeries
+from tableseries.ts import TableSeries, TableSeriesError
 from tableseries.ts import TimeSeriesDayPartition, TimeSeriesMonthPartition, TimeSeriesYearPartition
 
 
@@ -83,9 +90,9 @@ class TableSeriesDayUnitTest(unittest.TestCase, EqualMinx, TableSeriesMixin):
         self.data_frame = self.prepare_dataframe(date=self.start_datetime, tz=pytz.UTC,
                                                  length=50000, freq="min")
         self.name = "APPL"
-        dtypes = [("value1", "int64"), ("value2", "int64")]
+        self.dtypes = [("value1", "int64"), ("value2", "int64")]
 
-        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=dtypes)
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes)
 
     def tearDown(self):
         self.h5_series.close()
@@ -112,6 +119,22 @@ class TableSeriesDayUnitTest(unittest.TestCase, EqualMinx, TableSeriesMixin):
         length = self.h5_series.length(self.name)
         self.assertEqual(self.data_frame.shape[0], length)
 
+    def test_get_length_after_delete(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        self.h5_series.delete(name=self.name,
+                              year=self.start_datetime.year,
+                              month=self.start_datetime.month,
+                              day=self.start_datetime.day)
+        filter_frame = self.data_frame.loc[self.data_frame.index.date != self.start_datetime.date()]
+        self.assertEqual(filter_frame.shape[0], self.h5_series.length(self.name))
+        self.assertEqual(filter_frame.index[0], self.h5_series.first_datetime(self.name))
+
+    def test_first_last_datetime(self):
+        self.assertIsNone(self.h5_series.last_datetime(self.name))
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        self.assertEqual(self.data_frame.index[0], self.h5_series.first_datetime(self.name))
+        self.assertEqual(self.data_frame.index[-1], self.h5_series.last_datetime(self.name))
+
     def test_assert_DataframeTypeError(self):
 
         frame = numpy.arange(1000)
@@ -124,6 +147,17 @@ class TableSeriesDayUnitTest(unittest.TestCase, EqualMinx, TableSeriesMixin):
         self.data_frame.columns = ["timestamp", "a1"]
         self.assertRaises(ValueError, self.h5_series.append, self.name, self.data_frame)
 
+    def test_assert_columns_length_error(self):
+        data_frame = self.data_frame[["value1"]]
+        self.assertRaises(ValueError, self.h5_series.append, self.name, data_frame)
+
+    def test_append_partition_groups(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        dates = sorted(set(self.data_frame.index.date))
+        date_list = [((date_.year, date_.month, date_.day),
+                      "/" + self.name + date_.strftime("/y%Y/m%m/d%d")) for date_ in dates]
+        self.assertListEqual(date_list, self.h5_series.date_groups(self.name))
+
     def test_assertError_timestamp_error(self):
         self.h5_series.append(name=self.name, data_frame=self.data_frame)
         start_time = self.start_datetime + timedelta(days=3)
@@ -153,6 +187,459 @@ class TableSeriesDayUnitTest(unittest.TestCase, EqualMinx, TableSeriesMixin):
 
         self.assert_frame_equal(self.data_frame, start_datetime=self.start_datetime)
 
+    def test_append_repeated_data_reject(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        repeated_data = self.data_frame.iloc[0:10]
+        self.assertRaises(TableSeriesError, self.h5_series.append, self.name, repeated_data, "reject")
+        self.assertEqual(self.data_frame.shape[0], self.h5_series.length(self.name))
+
+    def test_append_repeated_data_reject_later_partition(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[3000:3010])
+        # the earlier partitions aren't written when a later partition rejects the append
+        self.assertRaises(TableSeriesError, self.h5_series.append, self.name, self.data_frame.iloc[:3010],
+                          "reject")
+        self.assertEqual(10, self.h5_series.length(self.name))
+        self.assertEqual(1, len(self.h5_series.date_groups(self.name)))
+
+    def test_append_failed_statistics(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[3000:3010])
+        index_table = self.h5_series._index_table
+        calls = []
+
+        def fail_second(table_node):
+            calls.append(table_node)
+            if len(calls) == 2:
+                raise IOError("write failed")
+            index_table(table_node)
+
+        with mock.patch.object(self.h5_series, "_index_table", side_effect=fail_second):
+            self.assertRaises(IOError, self.h5_series.append, self.name, self.data_frame.iloc[:3000])
+        # the name statistics count the partitions written before the failure
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes)
+        nrows = sum(self.h5_series.h5_store.get_node(group_path, "table").nrows
+                    for _, group_path in self.h5_series.date_groups(self.name))
+        self.assertEqual(nrows, self.h5_series.length(self.name))
+        self.assertEqual(self.data_frame.index[0], self.h5_series.first_datetime(self.name))
+
+    def test_append_repeated_data_overwrite(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        repeated_data = self.data_frame.iloc[5:10] * 2
+        self.h5_series.append(name=self.name, data_frame=repeated_data, duplicates="overwrite")
+
+        filter_frame = self.data_frame.copy()
+        filter_frame.iloc[5:10] = repeated_data
+        self.assert_frame_equal(filter_frame, start_datetime=self.start_datetime)
+
+    def test_append_out_of_order_data(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[500:1000])
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[:500].iloc[::-1])
+
+        frame = self.data_frame.iloc[:1000]
+        self.assert_frame_equal(frame, start_datetime=self.start_datetime)
+        for date_key, group_path in self.h5_series.date_groups(self.name):
+            table_node = self.h5_series.h5_store.get_node(group_path, "table")
+            timestamps = table_node.col("timestamp")
+            self.assertTrue(table_node._v_parent._v_attrs.sorted)
+            self.assertTrue((numpy.diff(timestamps) > 0).all())
+
+        start_datetime = frame.index[100].to_pydatetime()
+        end_datetime = frame.index[900].to_pydatetime()
+        self.assert_frame_equal(frame.iloc[100:901], start_datetime=start_datetime, end_datetime=end_datetime)
+
+    def test_append_out_of_order_data_unsorted(self):
+        self.h5_series.sorted_append = False
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[500:1000])
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[:500])
+
+        frame = self.data_frame.iloc[:1000]
+        start_datetime = frame.index[100].to_pydatetime()
+        end_datetime = frame.index[900].to_pydatetime()
+        self.assert_frame_equal(frame.iloc[100:901], start_datetime=start_datetime, end_datetime=end_datetime)
+
+    def test_index_policy_deferred(self):
+        self.h5_series.index_policy = "deferred"
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[:1000])
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[1000:2000])
+        table_nodes = [self.h5_series.h5_store.get_node(group_path, "table")
+                       for _, group_path in self.h5_series.date_groups(self.name)]
+        self.assertFalse(any(table_node.indexed for table_node in table_nodes))
+        self.assert_frame_equal(self.data_frame.iloc[:2000], start_datetime=self.start_datetime)
+
+        self.h5_series.flush()
+        self.assertTrue(all(table_node.indexed for table_node in table_nodes))
+
+    def test_index_policy_manual(self):
+        self.h5_series.index_policy = "manual"
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        self.h5_series.flush()
+        partitions = len(self.h5_series.date_groups(self.name))
+        self.assertEqual(partitions, self.h5_series.reindex(self.name))
+        self.assertEqual(0, self.h5_series.reindex(self.name))
+
+    def test_append_buffered(self):
+        self.h5_series.buffer_rows = 1500
+        self.assertDictEqual({}, self.h5_series.append_buffered(self.name, self.data_frame.iloc[:1000]))
+        self.assertEqual(0, self.h5_series.length(self.name))
+
+        flushed = self.h5_series.append_buffered(self.name, self.data_frame.iloc[1000:2000])
+        self.assertDictEqual({self.name: 2000}, flushed)
+        self.h5_series.append_buffered(self.name, self.data_frame.iloc[1990:2100])
+        self.assertDictEqual({self.name: 100}, self.h5_series.flush())
+        self.assertDictEqual({}, self.h5_series.flush())
+        self.assert_frame_equal(self.data_frame.iloc[:2100], start_datetime=self.start_datetime)
+
+    def test_append_buffered_repeated_reject(self):
+        self.h5_series.append_buffered(self.name, self.data_frame.iloc[:10], duplicates="reject")
+        self.h5_series.append_buffered(self.name, self.data_frame.iloc[5:20], duplicates="reject")
+        self.h5_series.append_buffered("MSFT", self.data_frame.iloc[:10])
+        self.assertRaises(TableSeriesError, self.h5_series.flush)
+        # the other buffers are flushed, the failed buffer is kept
+        self.assertEqual(10, self.h5_series.length("MSFT"))
+        self.assertEqual(25, self.h5_series._buffers[(self.name, "reject")].size)
+        self.assertRaises(TableSeriesError, self.h5_series.close)
+
+    def test_get_granularity_range_workers(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[::2])
+        start_datetime = self.start_datetime + timedelta(hours=10)
+        end_datetime = self.start_datetime + timedelta(days=20)
+        filter_frame = self.data_frame.loc[(self.data_frame.index >= start_datetime)
+                                           & (self.data_frame.index <= end_datetime)]
+        with mock.patch.dict(os.environ, {"HDF5_USE_FILE_LOCKING": "TRUE"}):
+            # the workers can't open the file locked by the writable store
+            self.assertRaises(TableSeriesError, list, self.h5_series.get_granularity_range(
+                self.name, start_datetime, end_datetime, workers=2))
+
+        with mock.patch.dict(os.environ, {"HDF5_USE_FILE_LOCKING": "FALSE"}):
+            result_frame = pandas.concat(self.h5_series.get_granularity_range(self.name, start_datetime,
+                                                                              end_datetime, workers=2))
+            pandas.testing.assert_frame_equal(filter_frame.iloc[filter_frame.index.isin(result_frame.index)],
+                                              result_frame)
+
+            # the workers refresh to the rows appended after the last query
+            self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[1::2])
+            result_frame = pandas.concat(self.h5_series.get_granularity_range(self.name, start_datetime,
+                                                                              end_datetime, workers=2))
+            pandas.testing.assert_frame_equal(filter_frame, result_frame)
+
+    def test_get_aggregate(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        start_datetime = self.start_datetime + timedelta(hours=10)
+        end_datetime = self.start_datetime + timedelta(days=20)
+        filter_frame = self.data_frame.loc[(self.data_frame.index >= start_datetime)
+                                           & (self.data_frame.index <= end_datetime)]
+        result_frame = self.h5_series.get_aggregate(self.name, start_datetime, end_datetime, freq="1h",
+                                                    aggs={"value1": ["sum", "count", "mean"], "value2": "ohlc"},
+                                                    chunk_rows=777)
+        resampler = filter_frame.resample("1h")
+        expected_frame = pandas.DataFrame({"value1_sum": resampler["value1"].sum(),
+                                           "value1_count": resampler["value1"].count(),
+                                           "value1_mean": resampler["value1"].mean()})
+        expected_frame = expected_frame.join(resampler["value2"].ohlc().add_prefix("value2_"))
+        pandas.testing.assert_frame_equal(expected_frame, result_frame, check_names=False)
+
+        with self.assertRaises(ValueError):
+            self.h5_series.get_aggregate(self.name, start_datetime, freq="1Q", aggs={"value1": "sum"})
+        with self.assertRaises(ValueError):
+            self.h5_series.get_aggregate(self.name, start_datetime, aggs={"value1": "median"})
+
+    def test_tail_last(self):
+        self.assertIsNone(self.h5_series.tail(self.name, 10))
+        self.assertIsNone(self.h5_series.last(self.name))
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[:-1])
+        # the tail walks back into the partitions before the newest partition
+        pandas.testing.assert_frame_equal(self.data_frame.iloc[-3001:-1], self.h5_series.tail(self.name, 3000))
+        pandas.testing.assert_frame_equal(self.data_frame.iloc[-2:-1], self.h5_series.last(self.name))
+
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[-1:])
+        pandas.testing.assert_frame_equal(self.data_frame.iloc[-1:], self.h5_series.last(self.name))
+        pandas.testing.assert_frame_equal(self.data_frame[["value2"]].iloc[-1:],
+                                          self.h5_series.last(self.name, columns=["value2"]))
+        pandas.testing.assert_frame_equal(self.data_frame, self.h5_series.tail(self.name, 60000))
+
+    def test_get_granularity_range_chunks(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        start_datetime = self.start_datetime + timedelta(days=1)
+        end_datetime = self.start_datetime + timedelta(days=5)
+        filter_frame = self.data_frame.loc[(self.data_frame.index >= start_datetime)
+                                           & (self.data_frame.index <= end_datetime)]
+
+        frames = list(self.h5_series.get_granularity_range(self.name, start_datetime, end_datetime,
+                                                           chunk_rows=100))
+        self.assertTrue(all(len(frame) <= 100 for frame in frames))
+        self.assertGreater(len(frames), len(set(filter_frame.index.date)))
+        pandas.testing.assert_frame_equal(filter_frame, pandas.concat(frames))
+
+        frames = list(self.h5_series.get_granularity_iter(self.name, chunk_rows=1000))
+        self.assertTrue(all(len(frame) <= 1000 for frame in frames))
+        pandas.testing.assert_frame_equal(self.data_frame, pandas.concat(frames))
+
+        self.assertRaises(ValueError, list, self.h5_series.get_granularity_range(self.name, start_datetime,
+                                                                                 chunk_rows=0))
+        self.assertRaises(ValueError, list, self.h5_series.get_granularity_range(self.name, start_datetime,
+                                                                                 workers=2, chunk_rows=100))
+
+        # the unsorted partitions are paged too
+        self.h5_series.close()
+        os.remove(self.hdf5_file)
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes, sorted_append=False)
+        for start in range(0, 10000, 1000):
+            self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[start + 500:start + 1000])
+            self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[start:start + 500])
+        filter_frame = filter_frame.loc[filter_frame.index < self.data_frame.index[10000]]
+        frames = list(self.h5_series.get_granularity_range(self.name, start_datetime, end_datetime,
+                                                           columns=["value2"], chunk_rows=100))
+        self.assertTrue(all(len(frame) <= 100 for frame in frames))
+        pandas.testing.assert_frame_equal(filter_frame[["value2"]], pandas.concat(frames))
+        frames = list(self.h5_series.get_granularity_iter(self.name, chunk_rows=1000))
+        self.assertTrue(all(len(frame) <= 1000 for frame in frames))
+        pandas.testing.assert_frame_equal(self.data_frame.iloc[:10000], pandas.concat(frames))
+
+    def test_async_series(self):
+        async def run():
+            async with AsyncTableSeries(self.h5_series, max_workers=2) as series:
+                await asyncio.gather(series.append(self.name, self.data_frame.iloc[:3000]),
+                                     series.append(self.name, self.data_frame.iloc[3000:]))
+                self.assertEqual(len(self.data_frame), await series.length(self.name))
+                frames = [frame async for frame in series.get_granularity_range(self.name, self.start_datetime)]
+                pandas.testing.assert_frame_equal(self.data_frame, pandas.concat(frames))
+                date = self.data_frame.index[-1]
+                pandas.testing.assert_frame_equal(self.data_frame.loc[self.data_frame.index.date == date.date()],
+                                                  await series.get_granularity(self.name, date.year, date.month,
+                                                                               date.day))
+                pandas.testing.assert_frame_equal(self.data_frame.iloc[-1:], await series.last(self.name))
+
+        asyncio.get_event_loop().run_until_complete(run())
+        self.assertFalse(self.h5_series.h5_store.isopen)
+
+    def test_get_ranges(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        index = self.data_frame.index
+        starts = [index[10], index[1000], self.start_datetime - timedelta(days=10), index[-5]]
+        ends = [index[20], index[4000], self.start_datetime - timedelta(days=9), index[-1] + timedelta(days=1)]
+
+        results = self.h5_series.get_ranges(self.name, starts, ends)
+        self.assertEqual(4, len(results))
+        pandas.testing.assert_frame_equal(self.data_frame.iloc[10:21], results[0])
+        pandas.testing.assert_frame_equal(self.data_frame.iloc[1000:4001], results[1])
+        self.assertIsNone(results[2])
+        pandas.testing.assert_frame_equal(self.data_frame.iloc[-5:], results[3])
+
+        data_frame = self.h5_series.get_ranges(self.name, starts, ends, columns=["value2"], window_column="window")
+        self.assertListEqual([11, 3001, 5], data_frame.groupby("window").size().tolist())
+        pandas.testing.assert_frame_equal(self.data_frame[["value2"]].iloc[1000:4001],
+                                          data_frame.loc[data_frame["window"] == 1, ["value2"]])
+
+        self.assertRaises(ValueError, self.h5_series.get_ranges, self.name, starts, ends[:2])
+        self.assertRaises(ValueError, self.h5_series.get_ranges, self.name, ends, starts)
+        self.assertRaises(ValueError, self.h5_series.get_ranges, self.name, starts, ends, window_column="value1")
+
+    def test_hot_partition(self):
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes, hot_partition=True)
+        data_frame = self.data_frame.iloc[:4000]
+        dates = sorted(set(data_frame.index.date))
+        self.h5_series.append(name=self.name, data_frame=data_frame.iloc[:3000])
+        # the newest partition isn't written into the file
+        hot_date = data_frame.index[2999].date()
+        self.assertEqual(dates.index(hot_date), len(self.h5_series.date_groups(self.name)))
+        self.assertEqual(3000, self.h5_series.length(self.name))
+        self.assertEqual(data_frame.index[2999], self.h5_series.last_datetime(self.name))
+        self.assert_frame_equal(data_frame.iloc[:3000], start_datetime=self.start_datetime)
+        pandas.testing.assert_frame_equal(data_frame.iloc[1000:3000], self.h5_series.tail(self.name, 2000))
+        self.assertRaises(TableSeriesError, self.h5_series.append, self.name, data_frame.iloc[2999:3000],
+                          duplicates="reject")
+        # the memory only partition isn't indexed
+        self.h5_series.reindex(self.name)
+        with mock.patch.dict(os.environ, {"HDF5_USE_FILE_LOCKING": "FALSE"}):
+            # the workers read the hot partition written before the dispatch
+            pandas.testing.assert_frame_equal(data_frame.iloc[:3000], pandas.concat(
+                self.h5_series.get_granularity_range(self.name, self.start_datetime, workers=2)))
+
+        # the out of order rows are merged with the hot rows
+        overwrite_frame = data_frame.iloc[2990:3000] * 2
+        self.h5_series.append(self.name, overwrite_frame, duplicates="overwrite")
+        expected_frame = data_frame.iloc[2000:3000].copy()
+        expected_frame.iloc[990:] = overwrite_frame
+        pandas.testing.assert_frame_equal(expected_frame, self.h5_series.tail(self.name, 1000))
+        self.h5_series.append(self.name, data_frame.iloc[2990:3000], duplicates="overwrite")
+        self.assertEqual(3000, self.h5_series.length(self.name))
+
+        # the rollover writes the hot partition into the file
+        self.h5_series.append(name=self.name, data_frame=data_frame.iloc[3000:])
+        self.assertIn(hot_date, [datetime(*date_key).date() for date_key, _ in
+                                 self.h5_series.date_groups(self.name)])
+        self.assert_frame_equal(data_frame, start_datetime=self.start_datetime)
+
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes)
+        self.assertEqual(4000, self.h5_series.length(self.name))
+        self.assert_frame_equal(data_frame, start_datetime=self.start_datetime)
+
+    def test_partition_chunkshape(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        partition_rows = self.h5_series.h5_store.get_node("/" + self.name)._v_attrs["partition_rows"]
+        self.assertLessEqual(partition_rows, 1440)
+        table_node = self.h5_series.h5_store.get_node(self.h5_series.date_groups(self.name)[-1][1], "table")
+        self.assertEqual(self.h5_series._chunkshape(partition_rows), table_node.chunkshape)
+
+        # the rate is observed again at every new partition after a partial first partition
+        self.h5_series.append(name="IBM", data_frame=self.data_frame.iloc[-5:])
+        self.h5_series.append(name="IBM", data_frame=self.prepare_dataframe(
+            date=self.data_frame.index[-1] + timedelta(minutes=1), tz=pytz.UTC, length=20 * 1440, freq="min"))
+        partition_rows = self.h5_series.h5_store.get_node("/IBM")._v_attrs["partition_rows"]
+        self.assertGreater(partition_rows, 1000)
+        table_node = self.h5_series.h5_store.get_node(self.h5_series.date_groups("IBM")[-1][1], "table")
+        self.assertEqual(self.h5_series._chunkshape(partition_rows), table_node.chunkshape)
+
+        self.h5_series.close()
+        self.h5_series = TimeSeriesYearPartition(self.hdf5_file, column_dtypes=self.dtypes,
+                                                 rows_per_day=100000)
+        self.h5_series.append(name="MSFT", data_frame=self.data_frame)
+        table_node = self.h5_series.h5_store.get_node(self.h5_series.date_groups("MSFT")[0][1], "table")
+        self.assertEqual((1024 * 1024 // 24,), table_node.chunkshape)
+
+    def test_compact(self):
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes, sorted_append=False,
+                                                index_policy="manual")
+        for start in range(0, 5000, 500):
+            self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[start + 250:start + 500])
+            self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[start:start + 250])
+        self.h5_series.delete(self.name, year=self.start_datetime.year, month=self.start_datetime.month,
+                              day=self.start_datetime.day)
+
+        count = self.h5_series.compact(self.name, complib="zlib", complevel=9)
+        self.assertEqual(len(self.h5_series.date_groups(self.name)), count)
+        file_size = os.path.getsize(self.hdf5_file)
+        # the repack reclaims the space of the removed tables
+        self.h5_series.compact(self.name, complib="zlib", complevel=9, repack=True)
+        self.assertLess(os.path.getsize(self.hdf5_file), file_size)
+        for _, group_path in self.h5_series.date_groups(self.name):
+            table_node = self.h5_series.h5_store.get_node(group_path, "table")
+            self.assertTrue(table_node.indexed)
+            self.assertEqual("zlib", table_node.filters.complib)
+            self.assertTrue(self.h5_series._is_sorted(table_node))
+        filter_frame = self.data_frame.iloc[:5000]
+        filter_frame = filter_frame.loc[filter_frame.index.date != self.start_datetime.date()]
+        pandas.testing.assert_frame_equal(filter_frame, pandas.concat(
+            self.h5_series.get_granularity_range(self.name, filter_frame.index[0])))
+
+    def test_retier(self):
+        data_frame = self.prepare_dataframe(date=self.start_datetime - timedelta(days=20), tz=pytz.UTC,
+                                            length=20 * 1440, freq="min")
+        self.h5_series.append(name=self.name, data_frame=data_frame)
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes,
+                                                tiers=[("7D", "zlib", 9), ("2D", "blosc:lz4", 1)])
+
+        def complibs():
+            return [self.h5_series.h5_store.get_node(group_path, "table").filters.complib
+                    for _, group_path in self.h5_series.date_groups(self.name)]
+
+        expected_complibs = []
+        for date_ in sorted(set(data_frame.index.date)):
+            age = datetime.now(tz=pytz.UTC) - datetime(date_.year, date_.month, date_.day, tzinfo=pytz.UTC) \
+                - timedelta(days=1)
+            expected_complibs.append("zlib" if age >= timedelta(days=7)
+                                     else "blosc:lz4" if age >= timedelta(days=2) else "blosc:blosclz")
+        self.assertEqual(len(expected_complibs) - expected_complibs.count("blosc:blosclz"),
+                         self.h5_series.retier())
+        self.assertListEqual(expected_complibs, complibs())
+        self.assertEqual(0, self.h5_series.retier(self.name))
+        # compact keeps the partitions in their tier
+        self.h5_series.compact(self.name)
+        self.assertListEqual(expected_complibs, complibs())
+
+        # the new partitions are created in their tier
+        self.h5_series.append(name="MSFT", data_frame=data_frame)
+        self.assertEqual(0, self.h5_series.retier("MSFT"))
+        pandas.testing.assert_frame_equal(data_frame, pandas.concat(
+            self.h5_series.get_granularity_range("MSFT", data_frame.index[0].to_pydatetime())))
+
+        # the partitions younger than the first tier keep the compression of compact
+        self.h5_series.compact(self.name, complib="zlib", complevel=9)
+        self.h5_series.retier(self.name)
+        expected_complibs = ["zlib" if complib == "blosc:blosclz" else complib for complib in expected_complibs]
+        self.assertListEqual(expected_complibs, complibs())
+        # retier without the tiers keeps the compression
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes)
+        self.h5_series.compact(self.name, complib="zlib", complevel=9)
+        self.assertEqual(0, self.h5_series.retier())
+        self.assertListEqual(["zlib"] * len(expected_complibs), complibs())
+
+    def test_read_cache(self):
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes, cache_bytes=10 ** 6)
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[::2])
+        start_datetime = self.start_datetime + timedelta(hours=10)
+        end_datetime = self.start_datetime + timedelta(days=2)
+        filter_frame = self.data_frame.loc[(self.data_frame.index >= start_datetime)
+                                           & (self.data_frame.index <= end_datetime)]
+
+        self.assert_frame_equal(filter_frame.iloc[::2], start_datetime, end_datetime)
+        self.assert_frame_equal(filter_frame.iloc[::2], start_datetime, end_datetime)
+        partitions = len(set(filter_frame.index.date))
+        cache_info = self.h5_series.cache_info()
+        self.assertEqual(partitions, cache_info["misses"])
+        self.assertEqual(partitions, cache_info["hits"])
+
+        # the append invalidates the cached partitions it writes
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[1::2])
+        self.assert_frame_equal(filter_frame, start_datetime, end_datetime)
+        self.assertEqual(2 * partitions, self.h5_series.cache_info()["misses"])
+
+        # the partitions over the cache bytes are read by the timestamps and not cached
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes, cache_bytes=1000)
+        self.assert_frame_equal(filter_frame, start_datetime, end_datetime)
+        self.assertEqual({"hits": 0, "misses": 0, "entries": 0, "nbytes": 0, "max_bytes": 1000},
+                         self.h5_series.cache_info())
+
+        self.h5_series.delete(self.name)
+        self.assertEqual(0, self.h5_series.cache_info()["entries"])
+
+    def test_get_aggregate_rollups(self):
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes,
+                                                rollups=("1min", "1h", "1D"))
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[:20000:2])
+        # the out of order rows reduce the touched rollup rows again
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[1:20000:2])
+        date_ = self.start_datetime.date()
+        self.assertIn("/" + self.name + date_.strftime("/y%Y/m%m/d%d") + "/rollup_3600s", self.h5_series.h5_store)
+
+        start_datetime = self.start_datetime + timedelta(hours=10, seconds=30)
+        end_datetime = self.start_datetime + timedelta(days=20, minutes=7)
+        aggs = {"value1": ["sum", "count", "mean"], "value2": ["ohlc", "min"]}
+
+        # the store without the rollups leaves the rollup tables stale, they are read raw
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes)
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[20000:40000])
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes,
+                                                rollups=("1min", "1h", "1D"))
+        expected_frame = self.h5_series.get_aggregate(self.name, start_datetime, end_datetime, freq="1D",
+                                                      aggs=aggs, rollups=False)
+        pandas.testing.assert_frame_equal(expected_frame, self.h5_series.get_aggregate(
+            self.name, start_datetime, end_datetime, freq="1D", aggs=aggs))
+        # the next append builds the stale rollup tables again
+        self.h5_series.append(name=self.name, data_frame=self.data_frame.iloc[40000:])
+        group_path = self.h5_series.date_groups(self.name)[-1][1]
+        self.assertTrue(self.h5_series._rollup_current(self.h5_series.h5_store.get_node(group_path + "/rollup_60s"),
+                                                       self.h5_series._partition_statistics(group_path)))
+        for freq in ("1h", "6h", "2D"):
+            expected_frame = self.h5_series.get_aggregate(self.name, start_datetime, end_datetime, freq=freq,
+                                                          aggs=aggs, rollups=False)
+            result_frame = self.h5_series.get_aggregate(self.name, start_datetime, end_datetime, freq=freq,
+                                                        aggs=aggs)
+            pandas.testing.assert_frame_equal(expected_frame, result_frame)
+
+        with self.assertRaises(ValueError):
+            TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes, rollups=("7h",))
+
     def test_get_granularity_range_start_date_equal_end_date(self):
         self.h5_series.append(name=self.name, data_frame=self.data_frame)
         start_datetime = self.start_datetime
@@ -177,6 +664,19 @@ class TableSeriesDayUnitTest(unittest.TestCase, EqualMinx, TableSeriesMixin):
                        "/" + self.name + delete_date.strftime("/y%Y/m%m/d%d"))]
         self.assertNotIn(date_tuple, groups)
 
+    def test_date_groups_catalog_reopen(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        date_groups = self.h5_series.date_groups(self.name)
+        self.h5_series.close()
+
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes)
+        self.assertListEqual(date_groups, self.h5_series.date_groups(self.name))
+
+        self.h5_series.delete(name=self.name)
+        self.assertListEqual([], self.h5_series.date_groups(self.name))
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        self.assertListEqual(date_groups, self.h5_series.date_groups(self.name))
+
     def test_get_granularity_with_day(self):
         """
         :return:
@@ -192,6 +692,53 @@ class TableSeriesDayUnitTest(unittest.TestCase, EqualMinx, TableSeriesMixin):
                 pandas.testing.assert_frame_equal(frame, result_data)
                 break
 
+    def test_get_granularity_with_month(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        query_date = self.start_datetime.date()
+        result_data = self.h5_series.get_granularity(name=self.name,
+                                                     year=query_date.year,
+                                                     month=query_date.month)
+        filter_frame = self.data_frame.loc[(self.data_frame.index.year == query_date.year)
+                                           & (self.data_frame.index.month == query_date.month)]
+        pandas.testing.assert_frame_equal(filter_frame, result_data)
+
+    def test_get_granularity_with_columns(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        query_date = self.start_datetime.date()
+        result_data = self.h5_series.get_granularity(name=self.name, year=query_date.year, columns=["value2"])
+        filter_frame = self.data_frame.loc[self.data_frame.index.year == query_date.year, ["value2"]]
+        pandas.testing.assert_frame_equal(filter_frame, result_data)
+
+        with self.assertRaises(ValueError):
+            self.h5_series.get_granularity(name=self.name, year=query_date.year, columns=["value3"])
+
+    def test_get_granularity_range_with_columns(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        start_datetime = self.start_datetime + timedelta(hours=10)
+        end_datetime = self.start_datetime + timedelta(days=3)
+        filter_frame = self.data_frame.loc[(self.data_frame.index >= start_datetime)
+                                           & (self.data_frame.index <= end_datetime), ["value1"]]
+        result_frame = pandas.concat(self.h5_series.get_granularity_range(self.name, start_datetime,
+                                                                          end_datetime, columns=["value1"]))
+        pandas.testing.assert_frame_equal(filter_frame, result_frame)
+
+    def test_get_granularity_range_return_type(self):
+        self.h5_series.append(name=self.name, data_frame=self.data_frame)
+        start_datetime = self.start_datetime + timedelta(hours=10)
+        filter_frame = self.data_frame.loc[self.data_frame.index >= start_datetime]
+
+        records = numpy.concatenate(list(self.h5_series.get_granularity_range(self.name, start_datetime,
+                                                                              return_type="numpy")))
+        numpy.testing.assert_array_equal(filter_frame.index.asi8, records["timestamp"])
+        numpy.testing.assert_array_equal(filter_frame["value2"].values, records["value2"])
+
+        for columns in self.h5_series.get_granularity_range(self.name, start_datetime, return_type="dict"):
+            self.assertListEqual(["timestamp", "value1", "value2"], sorted(columns))
+            self.assertTrue(columns["value1"].flags["C_CONTIGUOUS"])
+
+        with self.assertRaises(ValueError):
+            self.h5_series.get_granularity(self.name, return_type="list")
+
     def test_get_granularity_with_day_iter(self):
         """
         :return:
@@ -241,6 +788,241 @@ class TableSeriesDayUnitTest(unittest.TestCase, EqualMinx, TableSeriesMixin):
         self.assertListEqual(result_data, group_list)
 
 
+class TableSeriesThreadUnitTest(unittest.TestCase, EqualMinx):
+    """
+    """
+
+    def setUp(self):
+        self.hdf5_file = "temp_thread.h5"
+        self.start_datetime = datetime(year=2018, month=1, day=1, hour=1, minute=1, second=0, tzinfo=pytz.UTC)
+        self.data_frame = self.prepare_dataframe(date=self.start_datetime, tz=pytz.UTC, length=5000, freq="min")
+        self.dtypes = [("value1", "int64"), ("value2", "int64")]
+        self.names = ["APPL{0}".format(number) for number in range(8)]
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes)
+
+    def tearDown(self):
+        self.h5_series.close()
+        os.remove(self.hdf5_file)
+
+    def run_threads(self, target):
+        errors = []
+
+        def run(name):
+            try:
+                target(name)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=run, args=(name,)) for name in self.names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertListEqual([], errors)
+
+    def test_append_threads(self):
+        def append(name):
+            for number in range(0, 5000, 500):
+                self.h5_series.append(name, self.data_frame.iloc[number:number + 500])
+
+        self.run_threads(append)
+        for name in self.names:
+            self.assertEqual(5000, self.h5_series.length(name))
+
+    def test_read_only_threads(self):
+        for name in self.names:
+            self.h5_series.append(name, self.data_frame)
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes,
+                                                mode="r", thread_safe=True, pool_size=3)
+
+        def read(name):
+            for _ in range(5):
+                frame = pandas.concat(self.h5_series.get_granularity_range(name, self.start_datetime))
+                numpy.testing.assert_array_equal(self.data_frame.values, frame.values)
+
+        self.run_threads(read)
+        self.assertRaises(TableSeriesError, self.h5_series.append, self.names[0], self.data_frame)
+
+    def test_read_only_refresh_threads(self):
+        for name in self.names[:3]:
+            self.h5_series.append(name, self.data_frame)
+        self.h5_series.close()
+        self.h5_series = TimeSeriesDayPartition(self.hdf5_file, column_dtypes=self.dtypes,
+                                                mode="r", thread_safe=True, pool_size=3)
+        errors = []
+        done = threading.Event()
+
+        def read(name):
+            try:
+                for _ in range(20):
+                    frame = self.h5_series.get_granularity(name, 2018, 1, 2)
+                    self.assertEqual(1440, frame.shape[0])
+            except Exception as error:
+                errors.append(error)
+
+        def refresh():
+            while not done.is_set():
+                self.h5_series.refresh()
+
+        threads = [threading.Thread(target=read, args=(name,), daemon=True) for name in self.names[:3]]
+        refresher = threading.Thread(target=refresh, daemon=True)
+        for thread in threads + [refresher]:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        done.set()
+        refresher.join(timeout=60)
+        self.assertFalse(any(thread.is_alive() for thread in threads + [refresher]))
+        self.assertListEqual([], errors)
+
+
+WRITER_SCRIPT = """
+import sys
+import pandas
+from tableseries.ts import TimeSeriesDayPartition
+
+store = TimeSeriesDayPartition(sys.argv[1], [("value1", "int64")], swmr=True)
+for day in range(2):
+    index = pandas.date_range("2018-01-0{0}".format(day + 1), periods=100, freq="min", tz="UTC")
+    store.append("APPL", pandas.DataFrame({"value1": range(100)}, index=index))
+    print("appended", flush=True)
+    sys.stdin.readline()
+store.close()
+"""
+
+
+class TableSeriesSWMRUnitTest(unittest.TestCase):
+    """
+    """
+
+    def setUp(self):
+        self.hdf5_file = "temp_swmr.h5"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        # the writer doesn't lock the file for the readers
+        env = dict(os.environ, PYTHONPATH=root, HDF5_USE_FILE_LOCKING="FALSE")
+        self.writer = subprocess.Popen([sys.executable, "-c", WRITER_SCRIPT, self.hdf5_file], env=env,
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+
+    def tearDown(self):
+        self.writer.communicate()
+        os.remove(self.hdf5_file)
+
+    def test_reader_refresh(self):
+        self.assertEqual("appended", self.writer.stdout.readline().strip())
+        reader = TimeSeriesDayPartition(self.hdf5_file, [("value1", "int64")], mode="r", swmr=True)
+        try:
+            self.assertEqual(100, reader.length("APPL"))
+
+            self.writer.stdin.write("\n")
+            self.writer.stdin.flush()
+            self.assertEqual("appended", self.writer.stdout.readline().strip())
+            reader.refresh()
+            self.assertEqual(200, reader.length("APPL"))
+            self.assertEqual(2, len(reader.date_groups("APPL")))
+        finally:
+            reader.close()
+            self.writer.stdin.write("\n")
+            self.writer.stdin.flush()
+
+    def test_reader_locked(self):
+        hdf5_file = "temp_swmr_locked.h5"
+        env = {key: value for key, value in os.environ.items() if key != "HDF5_USE_FILE_LOCKING"}
+        env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        writer = subprocess.Popen([sys.executable, "-c", WRITER_SCRIPT, hdf5_file], env=env,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+        try:
+            self.assertEqual("appended", writer.stdout.readline().strip())
+            self.assertRaises(TableSeriesError, TimeSeriesDayPartition, hdf5_file, [("value1", "int64")],
+                              mode="r", swmr=True)
+        finally:
+            writer.communicate()
+            os.remove(hdf5_file)
+
+
+class TableSeriesShardUnitTest(unittest.TestCase, EqualMinx):
+    """
+    """
+
+    def setUp(self):
+        self.directory = "temp_shards"
+        self.start_datetime = datetime(year=2018, month=12, day=20, tzinfo=pytz.UTC)
+        self.data_frame = self.prepare_dataframe(date=self.start_datetime, tz=pytz.UTC, length=30000, freq="min")
+        self.dtypes = [("value1", "int64"), ("value2", "int64")]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shard_by_name(self):
+        names = ["APPL", "MSFT", "GOOG", "AMZN"]
+        with TableSeries("day", self.directory, self.dtypes, shard_by="name", shards=3, max_open=2) as h5_series:
+            for name in names:
+                h5_series.append(name, self.data_frame.copy())
+            self.assertLessEqual(len(h5_series._stores), 2)
+            for name in names:
+                self.assertEqual(self.data_frame.shape[0], h5_series.length(name))
+            h5_series.delete("MSFT")
+            self.assertEqual(0, h5_series.length("MSFT"))
+        self.assertLessEqual(len(os.listdir(self.directory)), 3)
+
+        with TableSeries("day", self.directory, self.dtypes, shard_by="name", shards=3, mode="r") as h5_series:
+            start_datetime = self.start_datetime + timedelta(days=3)
+            pandas.testing.assert_frame_equal(self.data_frame.loc[self.data_frame.index >= start_datetime],
+                                              pandas.concat(h5_series.get_granularity_range("GOOG", start_datetime)))
+            self.assertRaises(TableSeriesError, h5_series.append, "IBM", self.data_frame)
+            self.assertRaises(TableSeriesError, h5_series.delete, "GOOG")
+
+    def test_shard_store_arguments(self):
+        # the positional store parameters are passed to the shard stores
+        with TableSeries("day", self.directory, self.dtypes, "ts", shard_by="name", shards=2) as h5_series:
+            h5_series.append("APPL", self.data_frame)
+            self.assertEqual(self.data_frame.shape[0], h5_series.length("APPL"))
+            with h5_series._shard(h5_series._name_shard("APPL")) as store:
+                self.assertEqual("ts", store.index_name)
+        self.assertRaises(TypeError, TableSeries, "day", self.directory, self.dtypes, shard_by="name", size=1)
+
+    def test_shard_threads(self):
+        names = ["APPL", "MSFT", "GOOG", "AMZN"]
+        errors = []
+
+        with TableSeries("day", self.directory, self.dtypes, shard_by="name", shards=4) as h5_series:
+            def append(name):
+                try:
+                    for number in range(0, 3000, 500):
+                        h5_series.append(name, self.data_frame.iloc[number:number + 500])
+                except Exception as error:
+                    errors.append(error)
+
+            threads = [threading.Thread(target=append, args=(name,)) for name in names]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertListEqual([], errors)
+            for name in names:
+                self.assertEqual(3000, h5_series.length(name))
+
+    def test_shard_by_year(self):
+        h5_series = TableSeries("month", self.directory, self.dtypes, shard_by="year", max_open=1)
+        self.name = "APPL"
+        h5_series.append(self.name, self.data_frame)
+        self.assertListEqual([2018, 2019], h5_series._years())
+        self.h5_series = h5_series
+        self.assert_frame_equal(self.data_frame, self.start_datetime)
+        start_datetime = self.start_datetime + timedelta(days=5)
+        end_datetime = self.start_datetime + timedelta(days=15)
+        self.assert_frame_equal(self.data_frame.loc[(self.data_frame.index >= start_datetime)
+                                                    & (self.data_frame.index <= end_datetime)],
+                                start_datetime, end_datetime)
+
+        h5_series.delete(self.name, year=2018)
+        self.assertEqual((self.data_frame.index.year == 2019).sum(), h5_series.length(self.name))
+        h5_series.close()
+
+        with self.assertRaises(ValueError):
+            TableSeries("day", self.directory, self.dtypes, shard_by="month")
+
+
 class TableSeriesTimezoneUnitTest(unittest.TestCase, EqualMinx):
     """
     """